@@ -1,4 +1,55 @@
-from dataclasses import dataclass
+import argparse
+import contextlib
+import copy
+import cProfile
+import csv
+import ctypes
+import ctypes.util
+import glob
+import heapq
+import hmac
+import importlib
+import importlib.util
+import io
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import platform
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from dataclasses import dataclass, field, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import shared_memory
+
+class LazyModule:
+    """Stand-in for a heavy dependency: imports it on first attribute access, then replaces itself in globals()"""
+    def __init__(self, name, alias=None):
+        self.__dict__['_name'] = name
+        self.__dict__['_alias'] = alias or name
+
+    def _load(self):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+# Nothing heavy is imported before it is used, so the menu and --start come up immediately
+np = LazyModule('numpy', 'np')
+cv2 = LazyModule('cv2')
+mss = LazyModule('mss')
+pyautogui = LazyModule('pyautogui')
+keyboard = LazyModule('keyboard')
 
 # Color gradient system - Green fade
 class Color:
@@ -24,20 +75,112 @@ def fade(text):
         '\033[38;5;28m',   # Green (reflection)
         '\033[38;5;34m',   # Medium green (reflection)
     ]
-    lines = text.split('\n')
-    result = []
-    total_chars = sum(len(line) for line in lines)
-    char_count = 0
-    
-    for line_num, line in enumerate(lines):
-        line_result = ""
-        for i, char in enumerate(line):
-            diagonal_pos = (line_num * 3 + i) // 4
-            color_index = diagonal_pos % len(colors)
-            line_result += colors[color_index] + char
-            char_count += 1
-        result.append(line_result)
-    return '\n'.join(result) + Color.RESET
+    return '\n'.join(
+        ''.join(colors[((line_num * 3 + i) // 4) % len(colors)] + char for i, char in enumerate(line))
+        for line_num, line in enumerate(text.split('\n'))
+    ) + Color.RESET
+
+LOG_ERROR, LOG_INFO, LOG_DEBUG = 0, 1, 2
+LOG_LEVEL_NAMES = ('error', 'info', 'debug')
+ANSI_ESCAPE = re.compile(r'\033\[[0-9;]*m')
+
+class Console:
+    """Event ring buffer drained by a background writer, with an in-place status line"""
+    def __init__(self, verbosity=LOG_INFO, capacity=4096):
+        self.verbosity = verbosity
+        self.events = deque(maxlen=capacity)
+        self.dropped = 0
+        self.status_source = None
+        self.status_width = 0
+        self.log_path = ''
+        self.log_file = None
+        self.refresh = 0.25
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.wake = threading.Event()
+
+    def log(self, message, level=LOG_INFO):
+        if level > self.verbosity and self.log_file is None:
+            return
+        if self.thread is None:
+            self.write([(time.time(), level, message)])
+            return
+        # deque.append is atomic, the hot loop never waits on the terminal
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append((time.time(), level, message))
+        if level == LOG_ERROR:
+            self.wake.set()
+
+    def start(self, verbosity=None, log_path='', refresh=0.25, capacity=None, status_source=None):
+        if verbosity is not None:
+            self.verbosity = verbosity
+        if capacity and capacity != self.events.maxlen:
+            self.events = deque(self.events, maxlen=capacity)
+        self.refresh = max(0.02, refresh)
+        # The status line is redrawn with a carriage return, which only makes sense on a terminal
+        self.status_source = status_source if sys.stdout.isatty() else None
+        if log_path:
+            self.log_path = log_path
+            self.log_file = open(log_path, 'a', encoding='utf-8')
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='console-writer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.wake.set()
+        self.thread.join()
+        self.thread = None
+        self.status_source = None
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+    def drain(self):
+        events = []
+        while True:
+            try:
+                events.append(self.events.popleft())
+            except IndexError:
+                return events
+
+    def write(self, events):
+        lines = [message for _, level, message in events if level <= self.verbosity]
+        if self.dropped:
+            lines.append(f"{Color.GRAY}… {self.dropped} console events dropped{Color.RESET}")
+            self.dropped = 0
+        if lines:
+            clear = '\r' + ' ' * self.status_width + '\r' if self.status_width else ''
+            self.status_width = 0
+            sys.stdout.write(clear + '\n'.join(lines) + '\n')
+        if self.log_file is not None and events:
+            self.log_file.write(''.join(
+                json.dumps({'time': round(stamp, 6), 'level': LOG_LEVEL_NAMES[level],
+                            'message': ANSI_ESCAPE.sub('', message).strip()}) + '\n'
+                for stamp, level, message in events))
+
+    def draw_status(self):
+        status = self.status_source()
+        width = len(ANSI_ESCAPE.sub('', status))
+        sys.stdout.write('\r' + status + ' ' * max(0, self.status_width - width))
+        self.status_width = width
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.wake.wait(self.refresh)
+            self.wake.clear()
+            self.write(self.drain())
+            if self.status_source is not None:
+                self.draw_status()
+            sys.stdout.flush()
+        self.write(self.drain())
+        if self.status_width:
+            sys.stdout.write('\n')
+            self.status_width = 0
+        sys.stdout.flush()
 
 @dataclass
 class Config:
@@ -49,16 +192,2365 @@ class Config:
     clicks_per_second: float = 20.0
     running: bool = False
     scan_interval: float = 10.0
+    adaptive_scan: bool = True
+    min_scan_interval: float = 0.25
+    max_scan_interval: float = 30.0
+    max_scan_duty: float = 0.25
     min_unique_colors: int = 4
     min_color_variance: float = 20.0
+    detector: str = 'points'
+    region_margin: float = 0.1
+    color_quantization: int = 15
+    min_color_pixels: int = 2
+    target_path: str = ''
+    target_offset_x: int = 0
+    target_offset_y: int = 0
+    zoom_level: int = 17
+    grid_offset_x: float = 0.0
+    grid_offset_y: float = 0.0
+    auto_calibrate: bool = True
+    calibration_tolerance: float = 0.35
+    grid_calibrations: dict = field(default_factory=dict)
+    incremental_scan: bool = True
+    requeue_cooldown: float = 10.0
+    background_scan: bool = True
+    frame_source: str = 'screen'
+    source_path: str = ''
+    replay_speed: float = 1.0
+    replay_loop: bool = False
+    record_path: str = ''
+    zero_copy_capture: bool = True
+    sparse_capture: bool = False
+    sparse_max_gap: int = 4
+    sparse_max_grabs: int = 8
+    scan_workers: int = 0
+    click_burst: int = 3
+    input_backend: str = 'pyautogui'
+    input_record_path: str = ''
+    verify_clicks: bool = True
+    verify_delay: float = 0.5
+    verify_batch: int = 64
+    verify_batch_wait: float = 0.25
+    verify_retries: int = 2
+    verify_backoff: float = 1.0
+    stats_interval: float = 5.0
+    metrics_file: str = ''
+    metrics_interval: float = 10.0
+    profile_scan_path: str = ''
+    verbosity: int = LOG_INFO
+    log_file: str = ''
+    status_refresh: float = 0.25
+    console_buffer: int = 4096
+    stop_key: str = 'q'
+    pause_key: str = 'p'
+    control_port: int = 0
+    control_token: str = ''
+    preview: str = ''
+    preview_fps: float = 2.0
+    preview_scale: float = 1.0
+    profile: str = ''
+    warm_start: bool = True
+    snapshot_max_age: float = 300.0
+
+PROFILE_DIR = os.environ.get('WPLACE_PROFILE_DIR') or os.path.join(os.path.expanduser('~'), '.wplace-legitbot', 'profiles')
+# Never written to disk: run state, the profile's own name, the control API secret and recording outputs,
+# which reloading would truncate
+PROFILE_EXCLUDED = ('running', 'profile', 'control_token', 'record_path', 'input_record_path')
+
+def profile_path(name, suffix='.json'):
+    if not re.fullmatch(r'[\w.-]+', name) or name.startswith('.'):
+        raise ValueError(f"invalid profile name {name!r}, use letters, digits, '.', '-' and '_'")
+    return os.path.join(PROFILE_DIR, name + suffix)
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted(name[:-5] for name in os.listdir(PROFILE_DIR) if name.endswith('.json'))
+
+def save_profile(config, name, overrides=None):
+    """Write config under a name; `overrides` maps a setting to its (replaced, applied) values, and a setting
+    still at its applied value is written as the value it replaced"""
+    path = profile_path(name)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    values = {entry.name: getattr(config, entry.name) for entry in fields(Config) if entry.name not in PROFILE_EXCLUDED}
+    for key, (replaced, applied) in (overrides or {}).items():
+        if key in values and values[key] == applied:
+            values[key] = replaced
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(values, f, indent=2)
+    os.replace(temp_path, path)
+    return path
+
+def load_profile(config, name):
+    """Update config from a saved profile; keys this version does not know are ignored"""
+    with open(profile_path(name)) as f:
+        values = json.load(f)
+    for entry in fields(Config):
+        if entry.name in values and entry.name not in PROFILE_EXCLUDED:
+            setattr(config, entry.name, values[entry.name])
+    config.profile = name
+    return config
+
+def cell_pixel(position):
+    """Whole pixel a cell boundary falls on; the tolerance keeps 10 * 7.3 on pixel 73 despite float rounding"""
+    return math.floor(position + 1e-9)
+
+def grid_axis(pixel_size, length, image_length, offset=0.0):
+    """Walk one canvas axis cell by cell and return its sample coordinates; a negative offset
+    (at most half a cell) starts with the partial leading cell, sampled over its visible pixels"""
+    positions = []
+    # Cells start at whole pixels, so a cell fits when its integer end does. Positions are computed
+    # from the offset rather than accumulated, so long axes do not drift
+    while cell_pixel(offset + (len(positions) + 1) * pixel_size) <= length:
+        positions.append(offset + len(positions) * pixel_size)
+    count = len(positions)
+    centers = np.zeros(count, dtype=np.float64)
+    valid = np.zeros(count, dtype=bool)
+    mid = np.zeros(count, dtype=np.intp)
+    high = np.zeros(count, dtype=np.intp)
+    low = np.zeros(count, dtype=np.intp)
+    bounds = np.zeros((2, count), dtype=np.intp)
+    for i, position in enumerate(positions):
+        start = max(cell_pixel(position), 0)
+        end = cell_pixel(position + pixel_size)
+        centers[i] = position + pixel_size / 2
+        if end > image_length or end <= start:
+            continue
+        size = end - start
+        center = size // 2
+        valid[i] = True
+        mid[i] = start + center
+        high[i] = start + int(center + (2/3) * (size - 1 - center))
+        low[i] = start + int(center - (2/3) * (center - 0))
+        bounds[:, i] = start, end
+    return centers, valid, mid, high, low, bounds
+
+class SparseFrame:
+    """Canvas frame of which only the sample rows were captured, stacked in row order"""
+    def __init__(self, rows_image, rows, shape, left=0):
+        self.rows_image = rows_image
+        self.rows = rows
+        self.shape = shape
+        # Canvas column of rows_image[:, 0] when only a column window was captured
+        self.left = left
+
+def row_runs(rows, max_gap, max_runs=0):
+    """Split sorted rows into (first, last) runs, merging rows at most max_gap apart and, with max_runs,
+    across the narrowest remaining gaps until at most max_runs runs are left"""
+    if len(rows) == 0:
+        return []
+    gaps = np.diff(rows)
+    breaks = np.flatnonzero(gaps > max_gap + 1)
+    if max_runs and len(breaks) >= max_runs:
+        widest = np.argsort(gaps[breaks], kind='stable')[len(breaks) - max_runs + 1:]
+        breaks = np.sort(breaks[widest])
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [len(rows) - 1]))
+    return [(int(start), int(end)) for start, end in zip(starts, ends)]
+
+class GridGeometry:
+    """Sample coordinates of every grid cell for one (pixel_size, canvas, image) layout"""
+    def __init__(self, pixel_size, canvas_width, canvas_height, image_width, image_height, offset_x=0.0, offset_y=0.0):
+        self.key = (pixel_size, canvas_width, canvas_height, image_width, image_height, offset_x, offset_y)
+        self.centers_x, valid_x, x_mid, x_right, x_left, self.bounds_x = grid_axis(pixel_size, canvas_width, image_width, offset_x)
+        self.centers_y, valid_y, y_mid, y_bottom, y_top, self.bounds_y = grid_axis(pixel_size, canvas_height, image_height, offset_y)
+        self.grid_width = len(self.centers_x)
+        self.grid_height = len(self.centers_y)
+        self.valid = valid_y[:, None] & valid_x[None, :]
+        # Sample order: center, right, left, bottom, top
+        self.rows = np.stack([y_mid, y_mid, y_mid, y_bottom, y_top])[:, :, None]
+        self.cols = np.stack([x_mid, x_right, x_left, x_mid, x_mid])[:, None, :]
+        self.flat_index = self.rows * image_width + self.cols
+        # Compact layout used by sparse captures: only the rows holding samples, in order
+        self.sample_rows = np.unique(self.rows)
+        row_lookup = np.zeros(image_height, dtype=np.intp)
+        row_lookup[self.sample_rows] = np.arange(len(self.sample_rows))
+        self.sparse_flat_index = row_lookup[self.rows] * image_width + self.cols
+        self.buffers = {}
+
+    def fits(self, frame):
+        """Whether a sparse frame holds exactly this geometry's sample rows"""
+        height, width = self.key[4], self.key[3]
+        return (tuple(frame.shape[:2]) == (height, width) and frame.left == 0 and frame.rows_image.shape[1] == width
+                and (frame.rows is self.sample_rows or np.array_equal(frame.rows, self.sample_rows)))
+
+    def sparse_index(self, frame):
+        """Flat sample indices into a sparse frame; raises ValueError when it was captured for another grid"""
+        if not self.fits(frame):
+            raise ValueError("sparse frame was captured for a different grid, capture it again")
+        return self.sparse_flat_index
+
+    def gather(self, image):
+        """Read the samples of every cell, ignoring any alpha channel"""
+        flat_index = self.flat_index
+        if isinstance(image, SparseFrame):
+            flat_index = self.sparse_index(image)
+            image = image.rows_image
+        elif not image.flags.c_contiguous:
+            return image[self.rows, self.cols, :3]
+        channels = image.shape[2]
+        # Two preallocated buffers alternate so the previous scan's samples stay intact for diffing
+        buffers = self.buffers.get(channels)
+        if buffers is None:
+            shape = self.flat_index.shape + (channels,)
+            buffers = self.buffers[channels] = [np.empty(shape, dtype=image.dtype), np.empty(shape, dtype=image.dtype)]
+        buffers.reverse()
+        buffer = buffers[0]
+        # Indices are in bounds by construction (sparse frames were checked above), 'clip' only
+        # skips the buffered copy that the default 'raise' mode makes
+        np.take(image.reshape(-1, channels), flat_index, axis=0, out=buffer, mode='clip')
+        return buffer[..., :3]
+
+@dataclass
+class ScanState:
+    geometry: object
+    settings: tuple
+    samples: object
+    has_nuances: object
+    scores: object
+
+@dataclass
+class ScanResult:
+    geometry: object
+    dirty: object
+    has_nuances: object
+    scores: object
+    full: bool
+    duration: float
+    tile_timings: object = None
+
+def analyze_samples(samples, min_color_variance):
+    """Vectorized analyze_pixel_region over gathered (5, ..., 3) samples"""
+    samples = samples.astype(np.float32)
+    diff = samples[1:] - samples[0]
+    squared = diff ** 2
+    distances = np.sqrt(squared[..., 0] + squared[..., 1] + squared[..., 2])
+    max_distance = distances.max(axis=0)
+    avg_distance = (((distances[0] + distances[1]) + distances[2]) + distances[3]) / np.float32(4)
+    has_nuances = (max_distance > min_color_variance) | (avg_distance > 15)
+    scores = max_distance + avg_distance
+    return has_nuances, scores
+
+def inset_bounds(bounds, valid, margin):
+    """[start, end) of the valid cells along one axis, shrunk by margin of the cell size on each side"""
+    starts, ends = bounds[:, valid]
+    inset = ((ends - starts) * margin).astype(np.intp)
+    inset = np.minimum(inset, (ends - starts - 1) // 2)
+    return starts + inset, ends - inset
+
+def table_sums(table, y0, y1, x0, x1):
+    """Per-cell sums read from a summed-area table at the four corners of every cell"""
+    y0, y1 = y0[:, None], y1[:, None]
+    x0, x1 = x0[None, :], x1[None, :]
+    return (table[y1, x1] - table[y0, x1]) - (table[y1, x0] - table[y0, x0])
+
+def region_statistics(image, geometry, margin):
+    """Per-cell pixel count, channel sums and squared-norm sums over each cell's inset region"""
+    valid_y = geometry.valid.any(axis=1)
+    valid_x = geometry.valid.any(axis=0)
+    y0, y1 = inset_bounds(geometry.bounds_y, valid_y, margin)
+    x0, x1 = inset_bounds(geometry.bounds_x, valid_x, margin)
+    pixels = np.ascontiguousarray(image[..., :3])
+    # int32 tables are exact as long as the whole frame sum fits, which holds up to 4K
+    depth = cv2.CV_32S if pixels.size * 255 < 2 ** 31 else cv2.CV_64F
+    sums = table_sums(cv2.integral(pixels, sdepth=depth), y0, y1, x0, x1)
+    # Squares and their channel total stay below 2**24, float32 holds them exactly
+    squared_norm = cv2.transform(cv2.multiply(pixels, pixels, dtype=cv2.CV_32F), np.ones((1, 3), dtype=np.float32))
+    squares = table_sums(cv2.integral(squared_norm, sdepth=cv2.CV_64F), y0, y1, x0, x1)
+    counts = (y1 - y0)[:, None] * (x1 - x0)[None, :]
+    return counts, sums, squares, (y0, y1, x0, x1)
+
+def count_region_colors(image, cells_y, cells_x, windows, quantization, min_pixels, chunk_pixels=1 << 20):
+    """Distinct quantized colors covering at least min_pixels pixels in each listed cell's window"""
+    y0, y1, x0, x1 = windows
+    # Gather the largest window so it stays rectangular; pixels outside a cell's own window get a
+    # sentinel code that sorts last and is not counted, so colors cover the same pixels as the variance
+    height = int((y1 - y0).max())
+    width = int((x1 - x0).max())
+    levels = 255 // quantization + 1
+    sentinel = levels ** 3
+    size = height * width
+    unique = np.zeros(len(cells_y), dtype=np.int32)
+    chunk = max(1, chunk_pixels // max(size, 1))
+    rows_offset = np.arange(height)
+    cols_offset = np.arange(width)
+    for first in range(0, len(cells_y), chunk):
+        chunk_y = cells_y[first:first + chunk]
+        chunk_x = cells_x[first:first + chunk]
+        rows = y0[chunk_y][:, None] + rows_offset
+        cols = x0[chunk_x][:, None] + cols_offset
+        inside = (rows < y1[chunk_y][:, None])[:, :, None] & (cols < x1[chunk_x][:, None])[:, None, :]
+        rows = np.minimum(rows, image.shape[0] - 1)
+        cols = np.minimum(cols, image.shape[1] - 1)
+        block = image[rows[:, :, None], cols[:, None, :], :3] // quantization
+        codes = (block[..., 0].astype(np.int32) * levels + block[..., 1]) * levels + block[..., 2]
+        codes[~inside] = sentinel
+        codes = codes.reshape(len(rows), size)
+        # Sorted codes turn each cell's color histogram into runs, one run per color
+        codes.sort(axis=1)
+        runs = np.ones(codes.shape, dtype=bool)
+        runs[:, 1:] = codes[:, 1:] != codes[:, :-1]
+        if min_pixels > 1:
+            # A run starting at i is long enough when position i + min_pixels - 1 still holds the same code
+            long_enough = np.zeros(codes.shape, dtype=bool)
+            span = size - min_pixels + 1
+            if span > 0:
+                long_enough[:, :span] = codes[:, min_pixels - 1:] == codes[:, :span]
+            runs &= long_enough
+        runs &= codes != sentinel
+        unique[first:first + chunk] = np.count_nonzero(runs, axis=1)
+    return unique
+
+def analyze_regions(image, geometry, statistics, cells_y, cells_x, config):
+    """Whole-region verdicts for the listed cells: RMS channel std-dev plus quantized color count"""
+    counts, sums, squares, windows = statistics
+    n = counts[cells_y, cells_x].astype(np.float64)
+    mean = sums[cells_y, cells_x] / n[:, None]
+    variance = np.maximum(squares[cells_y, cells_x] / n - (mean ** 2).sum(axis=1), 0.0) / 3
+    std_dev = np.sqrt(variance).astype(np.float32)
+    unique = np.ones(len(cells_y), dtype=np.int32)
+    # A region without any variance holds a single color, only the others need their colors counted
+    mixed = np.flatnonzero(variance > 1e-9)
+    if len(mixed):
+        unique[mixed] = count_region_colors(image, cells_y[mixed], cells_x[mixed], windows,
+                                            config.color_quantization, config.min_color_pixels)
+    has_nuances = (unique >= config.min_unique_colors) | (std_dev > config.min_color_variance)
+    scores = std_dev + unique
+    return has_nuances, scores
+
+# wplace palette (RGB), free colors first then premium ones; transparent is not a paintable color
+WPLACE_PALETTE = (
+    (0, 0, 0), (60, 60, 60), (120, 120, 120), (210, 210, 210), (255, 255, 255),
+    (96, 0, 24), (237, 28, 36), (255, 127, 39), (246, 170, 9), (249, 221, 59),
+    (255, 250, 188), (14, 185, 104), (19, 230, 123), (135, 255, 94), (12, 129, 110),
+    (16, 174, 166), (19, 225, 190), (40, 80, 158), (64, 147, 228), (96, 247, 242),
+    (107, 80, 246), (153, 177, 251), (120, 12, 153), (170, 56, 185), (224, 159, 249),
+    (203, 0, 122), (236, 31, 128), (243, 141, 169), (104, 70, 52), (149, 104, 42),
+    (248, 178, 119), (170, 170, 170), (165, 14, 30), (250, 128, 114), (228, 92, 26),
+    (214, 181, 148), (156, 132, 49), (197, 173, 49), (232, 212, 95), (74, 107, 58),
+    (90, 148, 74), (132, 197, 115), (15, 121, 159), (187, 250, 242), (125, 199, 255),
+    (77, 49, 184), (74, 66, 132), (122, 113, 196), (181, 174, 241), (219, 164, 99),
+    (209, 128, 81), (255, 197, 165), (155, 82, 73), (209, 128, 120), (250, 182, 164),
+    (123, 99, 82), (156, 132, 107), (51, 57, 65), (109, 117, 141), (179, 185, 209),
+    (109, 100, 63), (148, 140, 107), (205, 197, 158),
+)
+PALETTE_IGNORE = 255
+PALETTE_BITS = 6
+PALETTE_TABLES = {}
+
+def palette_tables():
+    """Built once: a 64x64x64 BGR -> palette index LUT and the palette as BGR rows (row 255 = ignored)"""
+    if not PALETTE_TABLES:
+        shift = 8 - PALETTE_BITS
+        levels = (np.arange(1 << PALETTE_BITS, dtype=np.int32) << shift) + (1 << shift) // 2
+        blue, green, red = np.meshgrid(levels, levels, levels, indexing='ij')
+        best = np.full(blue.shape, np.iinfo(np.int32).max, dtype=np.int32)
+        lut = np.zeros(blue.shape, dtype=np.uint8)
+        for index, (r, g, b) in enumerate(WPLACE_PALETTE):
+            distance = (blue - b) ** 2 + (green - g) ** 2 + (red - r) ** 2
+            closer = distance < best
+            best[closer] = distance[closer]
+            lut[closer] = index
+        colors = np.zeros((256, 3), dtype=np.float32)
+        colors[:len(WPLACE_PALETTE)] = np.array(WPLACE_PALETTE, dtype=np.float32)[:, ::-1]
+        # Exact palette colors must map to themselves whatever bin center they fall next to
+        exact = colors[:len(WPLACE_PALETTE)].astype(np.int32) >> shift
+        lut[exact[:, 0], exact[:, 1], exact[:, 2]] = np.arange(len(WPLACE_PALETTE))
+        PALETTE_TABLES['lut'] = lut.ravel()
+        PALETTE_TABLES['colors'] = colors
+    return PALETTE_TABLES['lut'], PALETTE_TABLES['colors']
+
+def palette_indices(bgr):
+    """Nearest palette index of every BGR color in a (..., 3) uint8 array, one table lookup each"""
+    lut, _ = palette_tables()
+    shift = 8 - PALETTE_BITS
+    quantized = bgr.astype(np.intp) >> shift
+    return lut[(quantized[..., 0] << (2 * PALETTE_BITS)) | (quantized[..., 1] << PALETTE_BITS) | quantized[..., 2]]
+
+def load_target_indices(path):
+    """Target PNG (one image pixel per wplace pixel) as palette indices, transparent pixels ignored"""
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError(f"cannot read target image {path}")
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    indices = palette_indices(image[..., :3])
+    if image.shape[2] == 4:
+        indices[image[..., 3] < 128] = PALETTE_IGNORE
+    return indices
+
+def analyze_target(centers, target):
+    """Cells whose center color maps to another palette index than the target; score = distance to the target color"""
+    _, colors = palette_tables()
+    mismatched = (target != PALETTE_IGNORE) & (palette_indices(centers) != target)
+    diff = centers.astype(np.float32) - colors[target]
+    scores = np.sqrt((diff ** 2).sum(axis=-1))
+    return mismatched, scores
+
+def init_tile_worker():
+    # Spawned workers import this script without running its __main__ block
+    global np, time
+    import numpy as np
+    import time
+
+TILE_FRAMES = {}
+
+def open_shared_frame(name, keep=None):
+    shm = TILE_FRAMES.get(name)
+    if shm is None:
+        # The scanner replaced a block, drop every handle but the other one still in use
+        for old in [old for old in TILE_FRAMES if old != keep]:
+            TILE_FRAMES.pop(old).close()
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+        TILE_FRAMES[name] = shm
+    return shm
+
+def analyze_tile(shm_name, shape, dtype, index_name, index_shape, tile, min_color_variance):
+    """Process pool task: gather and analyze one tile's samples straight from the shared frame and index"""
+    tile_start = time.perf_counter()
+    shm = open_shared_frame(shm_name, index_name)
+    index_shm = open_shared_frame(index_name, shm_name)
+    frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    flat_index = np.ndarray(index_shape, dtype=np.intp, buffer=index_shm.buf)
+    y0, y1, x0, x1 = tile
+    samples = np.take(frame.reshape(-1, shape[2]), flat_index[:, y0:y1, x0:x1], axis=0)[..., :3]
+    has_nuances, scores = analyze_samples(samples, min_color_variance)
+    del frame, flat_index
+    return has_nuances, scores, time.perf_counter() - tile_start
+
+class TiledScanner:
+    """Splits the grid into tiles and analyzes them in a process pool over a shared-memory frame"""
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = multiprocessing.get_context('spawn').Pool(workers, initializer=init_tile_worker)
+        self.shm = None
+        self.index = None
+        self.layout = None
+        self.timings = []
+
+    def tiles(self, geometry):
+        if self.layout is not None and self.layout[0] is geometry:
+            return self.layout[1]
+        count = self.workers * 2
+        grid_width = max(geometry.grid_width, 1)
+        grid_height = max(geometry.grid_height, 1)
+        tiles_x = min(grid_width, max(1, round(math.sqrt(count * grid_width / grid_height))))
+        tiles_y = min(grid_height, max(1, math.ceil(count / tiles_x)))
+        x_bounds = np.linspace(0, geometry.grid_width, tiles_x + 1).astype(int)
+        y_bounds = np.linspace(0, geometry.grid_height, tiles_y + 1).astype(int)
+        tiles = [(y0, y1, x0, x1)
+                 for y0, y1 in zip(y_bounds[:-1], y_bounds[1:])
+                 for x0, x1 in zip(x_bounds[:-1], x_bounds[1:])
+                 if y1 > y0 and x1 > x0]
+        self.layout = (geometry, tiles)
+        return tiles
+
+    def share(self, frame):
+        if self.shm is None or self.shm.size < frame.nbytes:
+            self.release()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(frame.nbytes, 1))
+        np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf)[...] = frame
+
+    def share_index(self, geometry, flat_index):
+        """Publish the sample indices once per geometry, scans then only send their shared-memory name"""
+        if self.index is not None and self.index[0] is geometry and self.index[1] is flat_index:
+            return self.index[2]
+        self.release_index()
+        shm = shared_memory.SharedMemory(create=True, size=max(flat_index.size * np.dtype(np.intp).itemsize, 1))
+        np.ndarray(flat_index.shape, dtype=np.intp, buffer=shm.buf)[...] = flat_index
+        self.index = (geometry, flat_index, shm)
+        return shm
+
+    def analyze(self, image, geometry, min_color_variance):
+        if isinstance(image, SparseFrame):
+            frame, flat_index = image.rows_image, geometry.sparse_index(image)
+        else:
+            frame, flat_index = image, geometry.flat_index
+        self.share(frame)
+        index_shm = self.share_index(geometry, flat_index)
+        tiles = self.tiles(geometry)
+        tasks = [(self.shm.name, frame.shape, frame.dtype.str, index_shm.name, flat_index.shape, tile, min_color_variance)
+                 for tile in tiles]
+        has_nuances = np.zeros((geometry.grid_height, geometry.grid_width), dtype=bool)
+        scores = np.zeros((geometry.grid_height, geometry.grid_width), dtype=np.float32)
+        self.timings = []
+        for (y0, y1, x0, x1), (tile_nuances, tile_scores, elapsed) in zip(tiles, self.pool.starmap(analyze_tile, tasks)):
+            has_nuances[y0:y1, x0:x1] = tile_nuances
+            scores[y0:y1, x0:x1] = tile_scores
+            self.timings.append(((x0, y0, x1, y1), elapsed))
+        return has_nuances, scores
+
+    def release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def release_index(self):
+        if self.index is not None:
+            self.index[2].close()
+            self.index[2].unlink()
+            self.index = None
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        self.release()
+        self.release_index()
+
+class TargetQueue:
+    """Indexed max-heap of grid cells ordered by score, stored in flat arrays"""
+    def __init__(self, cooldown=0.0):
+        self.cooldown = cooldown
+        self.reset(None)
+
+    def reset(self, geometry):
+        self.geometry = geometry
+        cells = geometry.grid_width * geometry.grid_height if geometry is not None else 0
+        self.grid_width = geometry.grid_width if geometry is not None else 0
+        self.centers_x = geometry.centers_x.tolist() if geometry is not None else []
+        self.centers_y = geometry.centers_y.tolist() if geometry is not None else []
+        self.heap = array('q')
+        self.position = array('q', [-1]) * cells
+        self.priority = array('f', [0.0]) * cells
+        self.clicked_at = array('d', [float('-inf')]) * cells
+
+    def __len__(self):
+        return len(self.heap)
+
+    def _before(self, a, b):
+        priority_a = self.priority[a]
+        priority_b = self.priority[b]
+        return priority_a > priority_b or (priority_a == priority_b and a < b)
+
+    def _place(self, index, cell):
+        self.heap[index] = cell
+        self.position[cell] = index
+
+    def _sift_up(self, index):
+        heap = self.heap
+        cell = heap[index]
+        while index > 0:
+            parent = (index - 1) >> 1
+            if not self._before(cell, heap[parent]):
+                break
+            self._place(index, heap[parent])
+            index = parent
+        self._place(index, cell)
+
+    def _sift_down(self, index):
+        heap = self.heap
+        size = len(heap)
+        cell = heap[index]
+        while True:
+            child = 2 * index + 1
+            if child >= size:
+                break
+            if child + 1 < size and self._before(heap[child + 1], heap[child]):
+                child += 1
+            if not self._before(heap[child], cell):
+                break
+            self._place(index, heap[child])
+            index = child
+        self._place(index, cell)
+
+    def recently_clicked(self, cell, now):
+        return now - self.clicked_at[cell] < self.cooldown
+
+    def push(self, cell, score, now=None, force=False):
+        now = time.monotonic() if now is None else now
+        if not force and self.recently_clicked(cell, now):
+            self.remove(cell)
+            return False
+        index = self.position[cell]
+        self.priority[cell] = score
+        if index < 0:
+            self.heap.append(cell)
+            self._sift_up(len(self.heap) - 1)
+        else:
+            self._sift_up(index)
+            self._sift_down(self.position[cell])
+        return True
+
+    def remove(self, cell):
+        index = self.position[cell]
+        if index < 0:
+            return False
+        last = self.heap.pop()
+        self.position[cell] = -1
+        if index < len(self.heap):
+            self._place(index, last)
+            self._sift_up(index)
+            self._sift_down(self.position[last])
+        return True
+
+    def pop(self, now=None):
+        if not self.heap:
+            return None
+        cell = self.heap[0]
+        self.remove(cell)
+        self.clicked_at[cell] = time.monotonic() if now is None else now
+        grid_y, grid_x = divmod(cell, self.grid_width)
+        return (self.centers_x[grid_x], self.centers_y[grid_y], self.priority[cell], grid_x, grid_y)
+
+    def rebuild(self, cells, scores, now=None):
+        """Replace the queue with the given cells; a sorted array is already a valid heap"""
+        now = time.monotonic() if now is None else now
+        position = np.frombuffer(self.position, dtype=np.int64)
+        priority = np.frombuffer(self.priority, dtype=np.float32)
+        clicked_at = np.frombuffer(self.clicked_at, dtype=np.float64)
+        keep = now - clicked_at[cells] >= self.cooldown
+        cells = cells[keep].astype(np.int64)
+        scores = scores[keep]
+        order = np.lexsort((cells, -scores))
+        cells = cells[order]
+        position[self.heap] = -1
+        priority[cells] = scores[order]
+        position[cells] = np.arange(len(cells))
+        self.heap = array('q', cells.tobytes())
+
+    def update(self, cells, scores, has_nuances, now=None):
+        """Re-score, insert or drop the given cells in place"""
+        now = time.monotonic() if now is None else now
+        for cell, score, nuanced in zip(cells.tolist(), scores.tolist(), has_nuances.tolist()):
+            if nuanced:
+                self.push(cell, score, now)
+            else:
+                self.remove(cell)
+
+class StageTimer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class Metrics:
+    """Rolling per-stage latency windows with p50/p95/p99 summaries, gauges and file export"""
+    def __init__(self, window=1024, enabled=True):
+        self.window = window
+        self.enabled = enabled
+        self.samples = {}
+        self.counts = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.null_timer = NullTimer()
+
+    def stage(self, name):
+        return StageTimer(self, name) if self.enabled else self.null_timer
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+                self.counts[name] = 0
+            samples.append(seconds)
+            self.counts[name] += 1
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def summary(self):
+        with self.lock:
+            windows = {name: np.fromiter(samples, dtype=np.float64) for name, samples in self.samples.items()}
+            counts = dict(self.counts)
+        stages = {}
+        for name, values in windows.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (0.0, 0.0, 0.0)
+            stages[name] = {'count': counts[name], 'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+        return stages
+
+    def status_line(self):
+        parts = [f"{name} {values['p50']*1000:.1f}/{values['p95']*1000:.1f}/{values['p99']*1000:.1f}"
+                 for name, values in self.summary().items()]
+        return "p50/p95/p99 ms: " + " | ".join(parts)
+
+    def render(self, prometheus=True):
+        """Current snapshot as Prometheus text exposition or JSON"""
+        stages = self.summary()
+        gauges = dict(list(self.gauges.items()))
+        if prometheus:
+            lines = ["# HELP wplace_stage_seconds Rolling per-stage latency",
+                     "# TYPE wplace_stage_seconds summary"]
+            for name, values in stages.items():
+                for quantile in ('p50', 'p95', 'p99'):
+                    lines.append(f'wplace_stage_seconds{{stage="{name}",quantile="0.{quantile[1:]}"}} {values[quantile]:.9f}')
+                lines.append(f'wplace_stage_seconds_count{{stage="{name}"}} {values["count"]}')
+            for name, value in gauges.items():
+                lines.append(f"# TYPE wplace_{name} gauge")
+                lines.append(f"wplace_{name} {value}")
+            return "\n".join(lines) + "\n"
+        return json.dumps({'timestamp': time.time(), 'stages': stages, 'gauges': gauges}, indent=2)
+
+    def export(self, path):
+        text = self.render(path.endswith('.prom'))
+        # Write then rename so scrapers never read a half-written file
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+NO_METRICS = Metrics(enabled=False)
+
+# Comb coherence (0-1) needed to trust a calibration, and below which the grid is considered lost
+CALIBRATION_MIN_CONFIDENCE = 0.25
+CALIBRATION_LOST_COHERENCE = 0.08
+# Distinct color steps an edge profile needs before its coherence means anything; a blank canvas has none
+CALIBRATION_MIN_EDGES = 8
+EDGE_MIN_STEP = 24
+# Consecutive incoherent re-checks before a full recalibration, and the pause after a failed one
+CALIBRATION_LOST_CHECKS = 3
+CALIBRATION_RETRY_SECONDS = 30.0
+
+@dataclass
+class GridCalibration:
+    pixel_size: float
+    offset_x: float
+    offset_y: float
+    confidence: float
+
+def edge_profile(image, axis, lines=512):
+    """Color steps between neighbouring columns (axis=1) or rows (axis=0), summed over up to `lines` lines"""
+    if isinstance(image, SparseFrame):
+        if axis == 0:
+            return None
+        image = image.rows_image
+    across = image.shape[1 - axis]
+    picked = np.linspace(0, across - 1, min(lines, across)).astype(np.intp)
+    # Lay the picked lines out as rows so both axes are differenced along contiguous memory
+    picked_lines = np.take(image, picked, axis=1 - axis)
+    if axis == 0:
+        picked_lines = picked_lines.swapaxes(0, 1)
+    picked_lines = np.ascontiguousarray(picked_lines[..., :3])
+    steps = cv2.absdiff(picked_lines[:, 1:], picked_lines[:, :-1])
+    return cv2.reduce(steps.reshape(len(picked), -1), 0, cv2.REDUCE_SUM, dtype=cv2.CV_64F).reshape(-1, 3).sum(axis=1)
+
+def edge_count(profile):
+    """Number of distinct color steps in an edge profile; neighbouring positions count as one anti-aliased edge"""
+    edges = profile >= EDGE_MIN_STEP
+    return int(np.count_nonzero(edges[1:] & ~edges[:-1])) + int(edges[:1].sum())
+
+def comb_response(profile, periods):
+    """Fourier coefficient of the profile at frequency 1/period, normalized so a perfect edge comb has magnitude 1"""
+    # Entry i is the step between pixel i and i + 1, so the edge sits at position i + 1
+    positions = np.arange(1, len(profile) + 1, dtype=np.float64)
+    waves = np.exp(-2j * np.pi * positions[None, :] / np.asarray(periods, dtype=np.float64)[:, None])
+    return (waves @ profile) / max(profile.sum(), 1e-9)
+
+def grid_edges(profile, period):
+    """Fold the edge profile onto one period: the peak phase, each position's distance from it and the
+    positions within a pixel of it. The strongest 1 px bin holds the cell edges; edges inside cells
+    (accents, outlines) would only pull a Fourier phase toward them"""
+    positions = np.arange(1, len(profile) + 1, dtype=np.float64)
+    folded = positions % period
+    bins = int(math.ceil(period))
+    histogram = np.bincount(np.minimum(folded.astype(np.intp), bins - 1), weights=profile, minlength=bins)
+    peak = float(np.argmax(histogram)) + 0.5
+    # Fractional periods spread the edges over a pixel around the bin, so recenter before the window
+    for _ in range(2):
+        distance = (folded - peak + period / 2) % period - period / 2
+        near = np.abs(distance) <= 1.0
+        weight = profile[near].sum()
+        if weight > 0:
+            peak += (distance[near] * profile[near]).sum() / weight
+    distance = (folded - peak + period / 2) % period - period / 2
+    return peak, distance, np.abs(distance) <= 1.0
+
+def refine_period(profiles, period, span=0.01):
+    """Period within `span` of the comb estimate that lines the clear grid edges of both axes up best. Edge k
+    sits at floor(offset + k * period), so at the right period each axis' residuals fit inside one pixel;
+    their spread is convex in the period, and a least-squares fit would follow the rounding sawtooth"""
+    axes = []
+    for profile in profiles:
+        peak, distance, near = grid_edges(profile, period)
+        clear = np.flatnonzero(near & (profile >= EDGE_MIN_STEP))
+        if len(clear) >= 2:
+            position = clear + 1.0
+            axes.append((position, np.round((position - distance[clear] - peak) / period)))
+    if not axes:
+        return period
+
+    def spread(candidate):
+        return sum(np.ptp(position - number * candidate) for position, number in axes)
+
+    low, high = period - span, period + span
+    for _ in range(50):
+        third = (high - low) / 3
+        if spread(low + third) <= spread(high - third):
+            high -= third
+        else:
+            low += third
+    return float((low + high) / 2)
+
+def comb_offset(profile, period):
+    """Grid offset in [-period/2, period/2) from the edge profile folded onto one period, picked so every
+    cell start floor(offset + k * period) lands on its edge; a negative offset marks a partial leading cell"""
+    peak, distance, near = grid_edges(profile, period)
+    # Edge k sits at floor(offset + k * period), so each one bounds the offset to [distance, distance + 1);
+    # take the middle of what the clear edges leave, or the edge centre for a blurred profile
+    clear = near & (profile >= EDGE_MIN_STEP)
+    if clear.any():
+        edge = peak + (distance[clear].max() + distance[clear].min() + 1) / 2
+    else:
+        edge = peak + 0.5
+    offset = edge % period
+    return float(offset - period if offset >= period / 2 else offset)
+
+def calibrate_grid(image, min_size=3.0, max_size=None, lines=512):
+    """Estimate pixel size and sub-pixel grid offset from edge-projection autocorrelation, refined on the edge comb"""
+    profiles = [edge_profile(image, 1, lines), edge_profile(image, 0, lines)]
+    if profiles[1] is None or min(len(p) for p in profiles) < 4 * min_size:
+        return None
+    if min(edge_count(profile) for profile in profiles) < CALIBRATION_MIN_EDGES:
+        return None
+    length = min(len(p) for p in profiles)
+    max_size = min(max_size or length / 3, length / 3)
+    # Biased autocorrelation of both axes: the first grid period is the strongest peak in range
+    correlation = np.zeros(length)
+    for profile in profiles:
+        centered = profile[:length] - profile[:length].mean()
+        size = 1 << (2 * length - 1).bit_length()
+        spectrum = np.fft.rfft(centered, size)
+        correlation += np.fft.irfft(spectrum * np.conj(spectrum), size)[:length] / max(np.dot(centered, centered), 1e-9)
+    lags = np.arange(int(math.ceil(min_size)), int(max_size) + 1)
+    if not len(lags):
+        return None
+    coarse = float(lags[np.argmax(correlation[lags])])
+    # With a fractional period the strongest lag can be a multiple that lands closer to an integer
+    # (73 px for 7.3 px cells), so refine every integer fraction of it down to min_size and keep the
+    # largest period that explains the edges
+    candidates = []
+    for divisor in range(1, int(coarse / min_size) + 1):
+        period = coarse / divisor
+        # Sub-pixel period: maximize the combined comb coherence, coarse then fine. The integer lag
+        # bounds the error to half a pixel per multiple, and steps stay well inside the coherence peak
+        step = min(0.01, period * period / (4 * length))
+        span = 0.55 / divisor
+        for span, steps in ((span, int(2 * span / step) + 1), (step, 41)):
+            periods = np.linspace(period - span, period + span, steps)
+            periods = periods[periods >= min_size]
+            coherence = sum(np.abs(comb_response(profile, periods)) for profile in profiles)
+            period = float(periods[np.argmax(coherence)])
+        candidates.append((period, float(coherence.max())))
+    best = max(coherence for _, coherence in candidates)
+    period = refine_period(profiles, max(period for period, coherence in candidates if coherence >= 0.8 * best))
+    confidence = float(np.mean([abs(comb_response(profile, [period])[0]) for profile in profiles]))
+    return GridCalibration(period, comb_offset(profiles[0], period), comb_offset(profiles[1], period), confidence)
+
+def check_calibration(image, pixel_size, offset_x, offset_y, lines=64):
+    """Cheap per-scan re-check at a known pixel size: current offsets and their comb coherence (None when too few edges)"""
+    checked = []
+    for axis, offset in ((1, offset_x), (0, offset_y)):
+        profile = edge_profile(image, axis, lines)
+        if profile is None or edge_count(profile) < CALIBRATION_MIN_EDGES:
+            checked.append((offset, None))
+            continue
+        response = comb_response(profile, [pixel_size])[0]
+        checked.append((comb_offset(profile, pixel_size), abs(response)))
+    return checked
+
+def canvas_monitor(config):
+    return {
+        "top": config.canvas_top_left_y,
+        "left": config.canvas_top_left_x,
+        "width": config.canvas_width,
+        "height": config.canvas_height
+    }
+
+def screenshot_frame(raw, width, height, zero_copy):
+    frame = np.frombuffer(raw, dtype=np.uint8).reshape(height, width, 4)
+    if zero_copy:
+        # BGRA view over the capture buffer, detection skips the alpha channel itself
+        return frame
+    return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+
+class FrameSource:
+    """Base frame source: read() returns a BGR or BGRA canvas frame, or None once the source is exhausted"""
+    live = False
+    name = 'frames'
+    metrics = NO_METRICS
+
+    def read(self, config):
+        raise NotImplementedError
+
+    def frame_size(self):
+        return None
+
+    def read_rows(self, config, rows):
+        """Capture only the given canvas rows; sources that cannot do it return the full frame"""
+        return self.read(config)
+
+    def read_window(self, config, rows, left, right):
+        """Capture the given rows between columns left and right as a SparseFrame, None when unsupported"""
+        return None
+
+    def clone(self):
+        return self
+
+    def close(self):
+        pass
+
+# Verification windows are grabbed as at most this many rectangles, split at the widest row gaps
+VERIFY_MAX_GRABS = 4
+
+class MssFrameSource(FrameSource):
+    """Live screen capture of the configured canvas area"""
+    live = True
+    name = 'screen'
 
-class WPlaceBot:
     def __init__(self):
-        self.config = Config()
+        self.sct = None
+        self.rows_buffers = {}
+
+    def read(self, config):
+        if self.sct is None:
+            self.sct = mss.mss()
+        with self.metrics.stage('grab'):
+            screenshot = self.sct.grab(canvas_monitor(config))
+        with self.metrics.stage('convert'):
+            return screenshot_frame(screenshot.raw, screenshot.width, screenshot.height, config.zero_copy_capture)
+
+    def read_rows(self, config, rows):
+        monitor = canvas_monitor(config)
+        return self.grab_rows(config, rows, 0, monitor["width"], config.sparse_max_grabs)
+
+    def read_window(self, config, rows, left, right):
+        return self.grab_rows(config, rows, left, right - left, VERIFY_MAX_GRABS)
+
+    def grab_rows(self, config, rows, left, width, max_grabs=0):
+        if self.sct is None:
+            self.sct = mss.mss()
+        monitor = canvas_monitor(config)
+        shape = (len(rows), width, 4)
+        # Scan and verification captures alternate, each keeps its own buffer
+        rows_buffer = self.rows_buffers.get(shape)
+        if rows_buffer is None:
+            rows_buffer = self.rows_buffers[shape] = np.empty(shape, dtype=np.uint8)
+        for first, last in row_runs(rows, config.sparse_max_gap, max_grabs):
+            top = int(rows[first])
+            strip_monitor = dict(monitor, top=monitor["top"] + top, left=monitor["left"] + left,
+                                 width=width, height=int(rows[last]) - top + 1)
+            with self.metrics.stage('grab'):
+                screenshot = self.sct.grab(strip_monitor)
+            strip = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+            rows_buffer[first:last + 1] = strip[rows[first:last + 1] - top]
+        return SparseFrame(rows_buffer, rows, (monitor["height"], monitor["width"], 4), left)
+
+    def clone(self):
+        # mss handles are per thread, every consumer gets its own instance
+        source = MssFrameSource()
+        source.metrics = self.metrics
+        return source
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
+
+class ReplaySource(FrameSource):
+    """Frame source that replays timestamped frames at real (1.0), accelerated or unthrottled (0) speed"""
+    def __init__(self, path, speed=1.0, loop=False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.replay_start = None
+        self.first_timestamp = None
+
+    def pace(self, timestamp):
+        if self.speed <= 0 or timestamp is None:
+            return
+        now = time.monotonic()
+        if self.replay_start is None or timestamp < self.first_timestamp:
+            self.replay_start = now
+            self.first_timestamp = timestamp
+            return
+        delay = self.replay_start + (timestamp - self.first_timestamp) / self.speed - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def next_frame(self):
+        raise NotImplementedError
+
+    def rewind(self):
+        raise NotImplementedError
+
+    def read(self, config):
+        frame, timestamp = self.next_frame()
+        if frame is None and self.loop:
+            self.rewind()
+            frame, timestamp = self.next_frame()
+        if frame is None:
+            return None
+        self.pace(timestamp)
+        return frame
+
+class PngDirectorySource(ReplaySource):
+    """Replays the PNG files of a directory in name order, optionally at a fixed frame rate"""
+    name = 'png'
+
+    def __init__(self, path, speed=1.0, loop=False, fps=0.0):
+        super().__init__(path, speed, loop)
+        self.files = sorted(glob.glob(os.path.join(path, '*.png')))
+        if not self.files:
+            raise FileNotFoundError(f"No PNG files in {path}")
+        self.fps = fps
+        self.index = 0
+
+    def next_frame(self):
+        if self.index >= len(self.files):
+            return None, None
+        index = self.index
+        self.index += 1
+        timestamp = index / self.fps if self.fps > 0 else None
+        return cv2.imread(self.files[index], cv2.IMREAD_COLOR), timestamp
+
+    def rewind(self):
+        self.index = 0
+
+    def frame_size(self):
+        image = cv2.imread(self.files[0], cv2.IMREAD_COLOR)
+        return image.shape[1], image.shape[0]
+
+class VideoFileSource(ReplaySource):
+    """Replays a video file using its own frame timestamps"""
+    name = 'video'
+
+    def __init__(self, path, speed=1.0, loop=False):
+        super().__init__(path, speed, loop)
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise FileNotFoundError(f"Cannot open video {path}")
+
+    def next_frame(self):
+        timestamp = self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        ok, frame = self.capture.read()
+        return (frame, timestamp) if ok else (None, None)
+
+    def rewind(self):
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def frame_size(self):
+        return (int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    def close(self):
+        self.capture.release()
+
+class RecordedSessionSource(ReplaySource):
+    """Replays a session written by SessionRecorder straight from its memory-mapped raw frames"""
+    name = 'session'
+
+    def __init__(self, path, speed=1.0, loop=False):
+        super().__init__(path, speed, loop)
+        with open(os.path.join(path, 'session.json')) as f:
+            header = json.load(f)
+        self.shape = (header['height'], header['width'], header['channels'])
+        with open(os.path.join(path, 'timestamps.txt')) as f:
+            self.timestamps = [float(line) for line in f if line.strip()]
+        frame_bytes = self.shape[0] * self.shape[1] * self.shape[2]
+        raw_path = os.path.join(path, 'frames.raw')
+        count = min(len(self.timestamps), os.path.getsize(raw_path) // frame_bytes)
+        if count == 0:
+            raise FileNotFoundError(f"No recorded frames in {path}")
+        self.frames = np.memmap(raw_path, dtype=np.uint8, mode='r', shape=(count,) + self.shape)
+        self.index = 0
+
+    def next_frame(self):
+        if self.index >= len(self.frames):
+            return None, None
+        index = self.index
+        self.index += 1
+        return self.frames[index], self.timestamps[index]
+
+    def rewind(self):
+        self.index = 0
+
+    def frame_size(self):
+        return self.shape[1], self.shape[0]
+
+    def close(self):
+        self.frames._mmap.close()
+
+class SessionRecorder(FrameSource):
+    """Wraps a frame source and appends every frame it reads to a replayable raw recording"""
+    def __init__(self, source, path):
+        self.source = source
+        self.path = path
+        self.live = source.live
+        self.name = source.name
+        self.lock = threading.Lock()
+        self.shape = None
+        self.start = None
+        self.parent = None
+        os.makedirs(path, exist_ok=True)
+        self.frames_file = open(os.path.join(path, 'frames.raw'), 'wb')
+        self.timestamps_file = open(os.path.join(path, 'timestamps.txt'), 'w')
+
+    def read(self, config):
+        frame = self.source.read(config)
+        if frame is not None:
+            self.record(frame)
+        return frame
+
+    def frame_size(self):
+        return self.source.frame_size()
+
+    def read_window(self, config, rows, left, right):
+        # Verification windows are not canvas frames, they are not recorded
+        return self.source.read_window(config, rows, left, right)
+
+    def clone(self):
+        recorder = copy.copy(self)
+        recorder.source = self.source.clone()
+        recorder.parent = self
+        return recorder
+
+    def record(self, frame):
+        if self.parent is not None:
+            return self.parent.record(frame)
+        with self.lock:
+            now = time.monotonic()
+            if self.shape is None:
+                self.shape = frame.shape
+                self.start = now
+                with open(os.path.join(self.path, 'session.json'), 'w') as f:
+                    json.dump({'width': frame.shape[1], 'height': frame.shape[0], 'channels': frame.shape[2]}, f)
+            if frame.shape != self.shape:
+                return
+            self.frames_file.write(np.ascontiguousarray(frame).tobytes())
+            self.timestamps_file.write(f"{now - self.start:.6f}\n")
+            self.frames_file.flush()
+            self.timestamps_file.flush()
+
+    def close(self):
+        self.source.close()
+        if self.parent is None:
+            self.frames_file.close()
+            self.timestamps_file.close()
+
+# Fixed cost SyntheticFrameSource charges per grab, roughly one X11 round trip of mss
+SYNTHETIC_GRAB_LATENCY = 0.0005
+
+class SyntheticFrameSource(FrameSource):
+    """Headless stand-in for live capture: serves a fixed canvas through the same buffer handling as mss,
+    charging a fixed latency per grab so batched and sparse captures cost what their grab count implies"""
+    name = 'synthetic'
+
+    def __init__(self, image, grab_latency=SYNTHETIC_GRAB_LATENCY):
+        self.height, self.width = image.shape[:2]
+        self.bgra = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA).tobytes()
+        self.grab_latency = grab_latency
+        self.grabs = 0
+
+    def grab(self, top, left, width, height):
+        """One simulated grab: the fixed latency plus a fresh copy of the rectangle, as mss hands out"""
+        self.grabs += 1
+        with self.metrics.stage('grab'):
+            if self.grab_latency > 0:
+                time.sleep(self.grab_latency)
+            frame = np.frombuffer(self.bgra, dtype=np.uint8).reshape(self.height, self.width, 4)
+            return frame[top:top + height, left:left + width].copy()
+
+    def read(self, config):
+        strip = self.grab(0, 0, self.width, self.height)
+        return screenshot_frame(strip.data, self.width, self.height, config.zero_copy_capture)
+
+    def read_rows(self, config, rows):
+        return self.grab_rows(config, rows, 0, self.width, config.sparse_max_grabs)
+
+    def read_window(self, config, rows, left, right):
+        return self.grab_rows(config, rows, left, right - left, VERIFY_MAX_GRABS)
+
+    def grab_rows(self, config, rows, left, width, max_grabs=0):
+        rows_buffer = np.empty((len(rows), width, 4), dtype=np.uint8)
+        for first, last in row_runs(rows, config.sparse_max_gap, max_grabs):
+            top = int(rows[first])
+            strip = self.grab(top, left, width, int(rows[last]) - top + 1)
+            rows_buffer[first:last + 1] = strip[rows[first:last + 1] - top]
+        return SparseFrame(rows_buffer, rows, (self.height, self.width, 4), left)
+
+    def frame_size(self):
+        return self.width, self.height
+
+FRAME_SOURCES = {
+    'screen': 'Live screen capture (mss)',
+    'png': 'Directory of PNG frames',
+    'video': 'Video file',
+    'session': 'Recorded session (raw frames)',
+}
+
+def create_frame_source(config):
+    kind = config.frame_source
+    if kind == 'screen':
+        source = MssFrameSource()
+    elif kind == 'png':
+        source = PngDirectorySource(config.source_path, config.replay_speed, config.replay_loop)
+    elif kind == 'video':
+        source = VideoFileSource(config.source_path, config.replay_speed, config.replay_loop)
+    elif kind == 'session':
+        source = RecordedSessionSource(config.source_path, config.replay_speed, config.replay_loop)
+    else:
+        raise ValueError(f"Unknown frame source: {kind}")
+    if config.record_path:
+        source = SessionRecorder(source, config.record_path)
+    return source
+
+class InputBackend:
+    """Base mouse backend: click_at() moves the pointer to screen coordinates and left-clicks"""
+    name = 'input'
+
+    def prepare(self):
+        """Called once before the click loop starts"""
+        pass
+
+    def click_at(self, x, y):
+        raise NotImplementedError
+
+    def position(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class PyAutoGuiBackend(InputBackend):
+    """Portable default, honours pyautogui's corner fail-safe"""
+    name = 'pyautogui'
+
+    def prepare(self):
         pyautogui.FAILSAFE = True
         pyautogui.PAUSE = 0.0
-        self.small_pixels = []
-        self.sct = mss.mss()
+
+    def click_at(self, x, y):
+        pyautogui.moveTo(x, y, duration=0)
+        pyautogui.click()
+
+    def position(self):
+        return tuple(pyautogui.position())
+
+class XTestBackend(InputBackend):
+    """Direct X11 XTest injection: motion, press and release go out in a single flush, no round-trip per click"""
+    name = 'xtest'
+    failsafe_interval = 0.1
+
+    def __init__(self):
+        libraries = [ctypes.util.find_library(name) for name in ('X11', 'Xtst')]
+        if None in libraries:
+            raise OSError("XTest needs libX11 and libXtst (e.g. apt install libxtst6)")
+        self.x11, self.xtst = (ctypes.CDLL(library) for library in libraries)
+        display_p, window = ctypes.c_void_p, ctypes.c_ulong
+        self.x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self.x11.XOpenDisplay.restype = display_p
+        self.x11.XDefaultRootWindow.argtypes = [display_p]
+        self.x11.XDefaultRootWindow.restype = window
+        self.x11.XDefaultScreen.argtypes = [display_p]
+        self.x11.XDisplayWidth.argtypes = [display_p, ctypes.c_int]
+        self.x11.XDisplayHeight.argtypes = [display_p, ctypes.c_int]
+        self.x11.XFlush.argtypes = [display_p]
+        self.x11.XCloseDisplay.argtypes = [display_p]
+        int_p, uint_p, window_p = ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(window)
+        self.x11.XQueryPointer.argtypes = [display_p, window, window_p, window_p, int_p, int_p, int_p, int_p, uint_p]
+        self.xtst.XTestFakeMotionEvent.argtypes = [display_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        self.xtst.XTestFakeButtonEvent.argtypes = [display_p, ctypes.c_uint, ctypes.c_int, ctypes.c_ulong]
+        self.display = self.x11.XOpenDisplay(None)
+        if not self.display:
+            raise OSError("Cannot open the X display, is $DISPLAY set?")
+        self.root = self.x11.XDefaultRootWindow(self.display)
+        screen = self.x11.XDefaultScreen(self.display)
+        self.width = self.x11.XDisplayWidth(self.display, screen)
+        self.height = self.x11.XDisplayHeight(self.display, screen)
+        self.next_failsafe = 0.0
+
+    def click_at(self, x, y):
+        now = time.monotonic()
+        if now >= self.next_failsafe:
+            # Same corner fail-safe as pyautogui, but the pointer query is a round-trip so it is rate limited
+            self.next_failsafe = now + self.failsafe_interval
+            px, py = self.position()
+            if px in (0, self.width - 1) and py in (0, self.height - 1):
+                raise RuntimeError("Fail-safe triggered: mouse moved to a screen corner")
+        self.xtst.XTestFakeMotionEvent(self.display, -1, int(x), int(y), 0)
+        self.xtst.XTestFakeButtonEvent(self.display, 1, 1, 0)
+        self.xtst.XTestFakeButtonEvent(self.display, 1, 0, 0)
+        self.x11.XFlush(self.display)
+
+    def position(self):
+        root, child = ctypes.c_ulong(), ctypes.c_ulong()
+        x, y, wx, wy, mask = ctypes.c_int(), ctypes.c_int(), ctypes.c_int(), ctypes.c_int(), ctypes.c_uint()
+        self.x11.XQueryPointer(self.display, self.root, ctypes.byref(root), ctypes.byref(child),
+                               ctypes.byref(x), ctypes.byref(y), ctypes.byref(wx), ctypes.byref(wy), ctypes.byref(mask))
+        return x.value, y.value
+
+    def close(self):
+        if self.display:
+            self.x11.XCloseDisplay(self.display)
+            self.display = None
+
+class RecordingBackend(InputBackend):
+    """No-op stand-in that only timestamps clicks, for headless throughput and pacing measurements"""
+    name = 'record'
+
+    def __init__(self, path=''):
+        self.path = path
+        self.times = array('d')
+        self.xs = array('i')
+        self.ys = array('i')
+
+    def click_at(self, x, y):
+        self.times.append(time.perf_counter())
+        self.xs.append(int(x))
+        self.ys.append(int(y))
+
+    def position(self):
+        return (self.xs[-1], self.ys[-1]) if self.times else (0, 0)
+
+    def intervals(self):
+        return np.diff(np.frombuffer(self.times, dtype=np.float64))
+
+    def close(self):
+        if self.path and self.times:
+            with open(self.path, 'w') as f:
+                f.write("time,x,y\n")
+                f.writelines(f"{t:.6f},{x},{y}\n" for t, x, y in zip(self.times, self.xs, self.ys))
+
+INPUT_BACKENDS = {
+    'pyautogui': 'pyautogui (portable)',
+    'xtest': 'X11 XTest (Linux, lowest latency)',
+    'record': 'Recording only, no clicks (headless benchmarks)',
+}
+
+def create_input_backend(config):
+    kind = config.input_backend
+    if kind == 'pyautogui':
+        return PyAutoGuiBackend()
+    if kind == 'xtest':
+        return XTestBackend()
+    if kind == 'record':
+        return RecordingBackend(config.input_record_path)
+    raise ValueError(f"Unknown input backend: {kind}")
+
+class ClickPacer:
+    """Deadline-based click pacing on a monotonic clock, token-bucket catch-up capped at burst clicks"""
+    def __init__(self, clicks_per_second, burst=3, spin=0.001):
+        self.interval = 1.0 / clicks_per_second
+        self.burst = max(1, burst)
+        self.spin = spin
+        self.start = time.perf_counter()
+        self.deadline = self.start
+        self.released = self.start
+        self.clicks = 0
+        self.lateness = deque(maxlen=2048)
+        self.click_times = deque(maxlen=2048)
+        self.lost = {'scan': 0.0, 'waiting': 0.0, 'verify': 0.0, 'paused': 0.0}
+
+    def set_rate(self, clicks_per_second, burst=None):
+        self.interval = 1.0 / clicks_per_second
+        if burst is not None:
+            self.burst = max(1, burst)
+
+    def wait(self):
+        """Sleep until the next click deadline; the last `spin` seconds are busy-waited for precision"""
+        due = max(self.deadline, time.perf_counter())
+        while True:
+            remaining = self.deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            if remaining > self.spin:
+                time.sleep(remaining - self.spin)
+        self.released = time.perf_counter()
+        self.lateness.append(self.released - due)
+
+    def clicked(self):
+        self.click_times.append(self.released)
+        self.clicks += 1
+        # A bucket of `burst` tokens: fall at most burst - 1 intervals behind, then drop the missed clicks
+        self.deadline = max(self.deadline + self.interval, self.released - (self.burst - 2) * self.interval)
+
+    def idle(self, seconds, reason='waiting'):
+        self.lost[reason] += seconds
+        # Time without targets does not earn catch-up clicks beyond the bucket
+        self.deadline = max(self.deadline, time.perf_counter() - (self.burst - 1) * self.interval)
+
+    def achieved_cps(self):
+        elapsed = time.perf_counter() - self.start
+        return self.clicks / elapsed if elapsed > 0 else 0.0
+
+    def recent_cps(self, window=5.0):
+        now = time.perf_counter()
+        # Snapshot first, the console writer thread calls this while clicks are appended
+        recent = [t for t in tuple(self.click_times) if now - t <= window]
+        if len(recent) < 2:
+            return 0.0
+        return (len(recent) - 1) / (recent[-1] - recent[0]) if recent[-1] > recent[0] else 0.0
+
+    def jitter_percentiles(self):
+        if not self.lateness:
+            return 0.0, 0.0, 0.0
+        # Snapshot first, the control API reads this from its own thread
+        p50, p95, p99 = np.percentile(np.array(tuple(self.lateness), dtype=np.float64), [50, 95, 99])
+        return p50, p95, p99
+
+    def status(self, target_cps):
+        p50, p95, p99 = self.jitter_percentiles()
+        return (f"{self.recent_cps():.1f} CPS now, {self.achieved_cps():.1f} avg (target {target_cps:g}) - "
+                f"jitter p50/p95/p99 {p50*1000:.1f}/{p95*1000:.1f}/{p99*1000:.1f}ms - "
+                f"lost to scans {self.lost['scan']:.1f}s, waiting for targets {self.lost['waiting']:.1f}s, "
+                f"verifying {self.lost['verify']:.1f}s, paused {self.lost['paused']:.1f}s")
+
+class ClickVerifier:
+    """Re-checks recently clicked cells in batches of a few screen grabs, retiring confirmed ones and requeueing failures"""
+    def __init__(self, bot):
+        self.bot = bot
+        self.pending = deque()
+        self.retries = []
+        self.sequence = 0
+        self.attempts = {}
+        self.confirmed = 0
+        self.failed = 0
+        self.abandoned = 0
+
+    def clicked(self, geometry, grid_x, grid_y, now=None):
+        now = time.monotonic() if now is None else now
+        self.pending.append((now + self.bot.config.verify_delay, geometry, grid_x, grid_y))
+
+    def requeue_due(self, now):
+        queue = self.bot.small_pixels
+        while self.retries and self.retries[0][0] <= now:
+            _, _, geometry, cell, score = heapq.heappop(self.retries)
+            if geometry is queue.geometry:
+                queue.push(cell, score, now, force=True)
+
+    def run(self, source, now=None):
+        """Verify the clicks whose settle delay elapsed once a full batch is due, or once the oldest one
+        waited verify_batch_wait seconds for it; returns how many cells were checked"""
+        now = time.monotonic() if now is None else now
+        self.requeue_due(now)
+        if not self.pending or self.pending[0][0] > now:
+            return 0
+        bot = self.bot
+        config = bot.config
+        # Run on every click loop pass, so without the wait each batch would hold a single click
+        if self.pending[0][0] + config.verify_batch_wait > now:
+            due = sum(1 for entry in itertools.islice(self.pending, config.verify_batch) if entry[0] <= now)
+            if due < config.verify_batch:
+                return 0
+        geometry = bot.small_pixels.geometry
+        batch = []
+        while self.pending and self.pending[0][0] <= now and len(batch) < config.verify_batch:
+            entry = self.pending.popleft()
+            # Clicks made on an older grid layout cannot be matched to the current cells any more
+            if entry[1] is geometry:
+                batch.append(entry)
+        if not batch:
+            return 0
+        grid_x = np.array([entry[2] for entry in batch], dtype=np.intp)
+        grid_y = np.array([entry[3] for entry in batch], dtype=np.intp)
+        rows = geometry.rows[:, grid_y, 0]
+        cols = geometry.cols[:, 0, grid_x]
+        with bot.metrics.stage('verify'):
+            window = source.read_window(config, np.unique(rows), int(cols.min()), int(cols.max()) + 1)
+            if window is None:
+                self.pending.clear()
+                return 0
+            samples = window.rows_image[np.searchsorted(window.rows, rows), cols - window.left, :3]
+            target = bot.target_grid(geometry)[grid_y, grid_x] if config.detector == 'target' else None
+            has_nuances, scores = bot.analyze_cells(samples, target, config.min_color_variance)
+        for x, y, still_wrong, score in zip(grid_x.tolist(), grid_y.tolist(), has_nuances.tolist(), scores.tolist()):
+            cell = y * geometry.grid_width + x
+            if not still_wrong:
+                self.confirmed += 1
+                self.attempts.pop(cell, None)
+                continue
+            self.failed += 1
+            attempts = self.attempts.get(cell, 0) + 1
+            if attempts > config.verify_retries:
+                # Give up, the regular rescans and requeue cooldown take over
+                self.abandoned += 1
+                self.attempts.pop(cell, None)
+                continue
+            self.attempts[cell] = attempts
+            retry_at = now + config.verify_backoff * 2 ** (attempts - 1)
+            self.sequence += 1
+            heapq.heappush(self.retries, (retry_at, self.sequence, geometry, cell, score))
+        return len(batch)
+
+    def status(self):
+        checked = self.confirmed + self.failed
+        rate = self.confirmed / checked * 100 if checked else 0.0
+        return (f"{checked} clicks verified: {self.confirmed} confirmed ({rate:.0f}%), {self.failed} failed, "
+                f"{self.abandoned} given up")
+
+class ScanScheduler:
+    """Picks the next rescan time from the canvas change rate, queue depth, scan cost and click throughput"""
+    def __init__(self, config, smoothing=0.3):
+        self.config = config
+        self.smoothing = smoothing
+        self.change_rate = None
+        self.scan_cost = None
+        self.last_scan = None
+        self.idle_scans = 0
+        self.forced = False
+        self.click_rate = lambda: config.clicks_per_second
+        self.queue_depth = lambda: 0
+
+    def smooth(self, average, value):
+        return value if average is None else average + self.smoothing * (value - average)
+
+    def observe(self, result, cost, now=None):
+        """Record a finished scan: its capture + analysis wall time and the cells it found changed"""
+        now = time.monotonic() if now is None else now
+        self.scan_cost = self.smooth(self.scan_cost, cost)
+        self.forced = False
+        if not result.full and self.last_scan is not None:
+            changed = int(np.count_nonzero(result.dirty))
+            self.change_rate = self.smooth(self.change_rate, changed / max(now - self.last_scan, 1e-3))
+            self.idle_scans = 0 if changed else self.idle_scans + 1
+        self.last_scan = now
+
+    def interval(self):
+        """Seconds between the previous scan and the next one"""
+        config = self.config
+        if not config.adaptive_scan:
+            return config.scan_interval
+        cost = self.scan_cost or 0.0
+        # Never spend more than max_scan_duty of the wall clock scanning
+        floor = max(config.min_scan_interval, cost * (1 / config.max_scan_duty - 1))
+        clicks = max(self.click_rate(), 1e-3)
+        # Prefetch: the next scan should land before the queue runs dry at the current click rate
+        dry = self.queue_depth() / clicks - cost
+        # A scan pays for its CPU once it can be expected to find as many new targets as clicks it takes
+        worth = max(1.0, cost * clicks)
+        busy = worth / self.change_rate if self.change_rate else config.max_scan_interval
+        delay = max(floor, min(dry, busy))
+        if self.idle_scans:
+            # Nothing changed lately: back off exponentially
+            delay = max(delay, floor * 2 ** min(self.idle_scans, 16))
+        return min(delay, config.max_scan_interval)
+
+    def request(self):
+        """Make the next scan due right away"""
+        self.forced = True
+
+    def remaining(self, now=None):
+        if self.last_scan is None or self.forced:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return self.last_scan + self.interval() - now
+
+    def status(self):
+        rate = self.change_rate or 0.0
+        cost = (self.scan_cost or 0.0) * 1000
+        mode = "adaptive" if self.config.adaptive_scan else "fixed"
+        return (f"next scan every {self.interval():.2f}s ({mode}) - {rate:.1f} changed cells/s, "
+                f"scan {cost:.0f}ms, {self.idle_scans} idle scans")
+
+class ScanWorker:
+    """Background producer that captures and analyzes the canvas while the clicker keeps clicking"""
+    def __init__(self, bot):
+        self.bot = bot
+        self.lock = threading.Lock()
+        self.pending = None
+        self.error = None
+        self.exhausted = False
+        self.wake = threading.Event()
+        self.published = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='scan-worker', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wake.set()
+        self.thread.join(timeout=5)
+
+    def request_scan(self):
+        self.wake.set()
+
+    def publish(self, result):
+        with self.lock:
+            pending = self.pending
+            if pending is not None and pending.geometry is result.geometry:
+                # The clicker has not consumed the previous scan yet, carry its dirty cells over
+                result.dirty |= pending.dirty
+                result.full = result.full or pending.full
+            self.pending = result
+        self.published.set()
+
+    def take(self):
+        with self.lock:
+            result, self.pending = self.pending, None
+        return result
+
+    def wait(self, timeout):
+        self.published.wait(timeout)
+        self.published.clear()
+
+    def run(self):
+        source = self.bot.source.clone()
+        try:
+            scheduler = self.bot.scheduler
+            while not self.stopping.is_set():
+                if source.live:
+                    remaining = scheduler.remaining()
+                    if remaining > 0:
+                        # Re-plan a few times per second, queue depth and click rate keep moving
+                        if not self.wake.wait(min(remaining, 0.25)):
+                            continue
+                        self.wake.clear()
+                scan_start = time.perf_counter()
+                result = self.bot.capture_and_scan(source)
+                if result is None:
+                    self.exhausted = True
+                    self.published.set()
+                    break
+                scheduler.observe(result, time.perf_counter() - scan_start)
+                self.publish(result)
+        except Exception as e:
+            self.error = e
+            self.published.set()
+        finally:
+            if source is not self.bot.source:
+                source.close()
+
+class OverlayRenderer:
+    """Draws the grid and detection markers; grid lines are cached per geometry and markers are drawn in bulk"""
+    grid_color = (200, 200, 200)
+
+    def __init__(self, radius=6, thickness=2, labels=30):
+        self.labels = labels
+        # One ring rasterized by cv2.circle, used as the structuring element that stamps every marker at once
+        size = 2 * (radius + thickness // 2) + 1
+        self.ring = np.zeros((size, size), dtype=np.uint8)
+        cv2.circle(self.ring, (size // 2, size // 2), radius, 1, thickness)
+        self.grid = None
+
+    def grid_lines(self, config, shape):
+        key = (config.pixel_size, config.canvas_width, config.canvas_height,
+               config.grid_offset_x, config.grid_offset_y, shape[0], shape[1])
+        if self.grid is None or self.grid[0] != key:
+            height, width = shape[:2]
+            cols = np.floor(np.arange(config.grid_offset_x, config.canvas_width, config.pixel_size) + 1e-9).astype(np.intp)
+            rows = np.floor(np.arange(config.grid_offset_y, config.canvas_height, config.pixel_size) + 1e-9).astype(np.intp)
+            self.grid = (key, rows[(rows >= 0) & (rows < height)], cols[(cols >= 0) & (cols < width)])
+        return self.grid[1], self.grid[2]
+
+    def render(self, image, config, targets):
+        """Annotated BGR copy of image; targets are (x, y, score, ...) rows in priority order"""
+        vis_image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR) if image.shape[2] == 4 else image.copy()
+        height, width = vis_image.shape[:2]
+        rows, cols = self.grid_lines(config, vis_image.shape)
+        vis_image[:, cols] = self.grid_color
+        vis_image[rows, :] = self.grid_color
+        targets = np.asarray(targets, dtype=np.float64)
+        if not len(targets):
+            return vis_image
+        xs = targets[:, 0].astype(np.intp)
+        ys = targets[:, 1].astype(np.intp)
+        # Red intensity at each marker center (at least 1 so it also marks the ring), then one dilation
+        # turns every center into its ring; where rings overlap the brighter one wins
+        red = np.clip(targets[:, 2] * 20, 1, 255).astype(np.uint8)
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        centers = np.zeros((height, width), dtype=np.uint8)
+        centers[ys[inside], xs[inside]] = red[inside]
+        rings = cv2.dilate(centers, self.ring)
+        blank = np.zeros_like(rings)
+        cv2.copyTo(cv2.merge([blank, blank, rings]), (rings > 0).view(np.uint8), vis_image)
+        for rank in range(min(self.labels, len(targets))):
+            cv2.putText(vis_image, f"{rank+1}", (int(xs[rank])+8, int(ys[rank])+8),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        return vis_image
+
+class LivePreview:
+    """Renders the latest scan on its own thread at a throttled frame rate, into a video file or a window"""
+    window_name = 'wplace-legitbot preview'
+
+    def __init__(self, bot, target, fps=2.0, scale=1.0):
+        self.bot = bot
+        self.target = target
+        self.interval = 1.0 / max(fps, 0.01)
+        self.fps = fps
+        self.scale = scale
+        self.renderer = OverlayRenderer()
+        self.latest = None
+        self.writer = None
+        self.frames = 0
+        self.error = None
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='preview', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.ready.set()
+        self.thread.join(timeout=5)
+
+    def offer(self, image, result):
+        """Hand over the latest full frame and its scan; never blocks the caller"""
+        if isinstance(image, SparseFrame):
+            return
+        self.latest = (image, result)
+        self.ready.set()
+
+    def render(self, image, result):
+        geometry = result.geometry
+        grid_y, grid_x = np.nonzero(result.has_nuances & geometry.valid)
+        scores = result.scores[grid_y, grid_x]
+        order = np.argsort(-scores, kind='stable')
+        targets = np.column_stack([geometry.centers_x[grid_x[order]], geometry.centers_y[grid_y[order]], scores[order]])
+        frame = self.renderer.render(image, self.bot.config, targets)
+        cv2.putText(frame, f"{time.strftime('%H:%M:%S')}  {len(targets)} targets", (8, 20),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return frame
+
+    def show(self, frame):
+        if self.target == 'window':
+            cv2.imshow(self.window_name, frame)
+            cv2.waitKey(1)
+            return
+        if self.writer is None:
+            fourcc = cv2.VideoWriter_fourcc(*('mp4v' if self.target.lower().endswith('.mp4') else 'MJPG'))
+            self.writer = cv2.VideoWriter(self.target, fourcc, self.fps, (frame.shape[1], frame.shape[0]))
+            if not self.writer.isOpened():
+                raise OSError(f"Cannot write preview video {self.target}")
+            self.size = (frame.shape[1], frame.shape[0])
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size)
+        self.writer.write(frame)
+
+    def run(self):
+        try:
+            while not self.stopping.is_set():
+                if not self.ready.wait(0.25):
+                    continue
+                self.ready.clear()
+                if self.latest is None:
+                    continue
+                slot = time.perf_counter() + self.interval
+                image, result = self.latest
+                with self.bot.metrics.stage('preview'):
+                    self.show(self.render(image, result))
+                self.frames += 1
+                # Scans arriving before the next slot only replace self.latest
+                self.stopping.wait(max(0.0, slot - time.perf_counter()))
+        except Exception as e:
+            self.error = e
+            self.bot.console.log(f"{Color.RED}❌ Preview stopped: {e}{Color.RESET}", LOG_ERROR)
+        finally:
+            if self.writer is not None:
+                self.writer.release()
+            elif self.target == 'window':
+                with contextlib.suppress(Exception):
+                    cv2.destroyWindow(self.window_name)
+
+# Config fields the control API may change on a running bot; they are applied between two scans
+CONTROL_SETTINGS = (
+    'clicks_per_second', 'click_burst', 'min_unique_colors', 'min_color_variance', 'pixel_size',
+    'grid_offset_x', 'grid_offset_y', 'zoom_level', 'auto_calibrate', 'calibration_tolerance',
+    'scan_interval', 'adaptive_scan', 'min_scan_interval', 'max_scan_interval', 'max_scan_duty',
+    'incremental_scan', 'requeue_cooldown', 'region_margin', 'color_quantization', 'min_color_pixels',
+    'verify_delay', 'verify_batch', 'verify_batch_wait', 'verify_retries', 'verify_backoff', 'stats_interval',
+    'metrics_interval', 'verbosity')
+GRID_SETTINGS = {'pixel_size', 'grid_offset_x', 'grid_offset_y'}
+# Accepted (min, max) of every numeric live setting; CPS, colors and variance use the Option 4 limits
+SETTING_RANGES = {
+    'clicks_per_second': (0.1, 100), 'click_burst': (1, 100), 'min_unique_colors': (2, 10),
+    'min_color_variance': (5, 50), 'pixel_size': (1, 1000), 'grid_offset_x': (-500, 1000), 'grid_offset_y': (-500, 1000),
+    'zoom_level': (0, 30), 'calibration_tolerance': (0, 10), 'scan_interval': (0, 3600),
+    'min_scan_interval': (0, 3600), 'max_scan_interval': (0, 3600), 'max_scan_duty': (0.01, 1),
+    'requeue_cooldown': (0, 3600), 'region_margin': (0, 0.45), 'color_quantization': (1, 255),
+    'min_color_pixels': (1, 10000), 'verify_delay': (0, 60), 'verify_batch': (1, 4096), 'verify_batch_wait': (0, 60),
+    'verify_retries': (0, 100),
+    'verify_backoff': (0, 3600), 'stats_interval': (0.1, 3600), 'metrics_interval': (0.1, 3600),
+    'verbosity': (LOG_ERROR, LOG_DEBUG)}
+
+def coerce_setting(name, value):
+    """Validate one live setting against the type of its Config default; raises ValueError"""
+    if name not in CONTROL_SETTINGS:
+        raise ValueError(f"{name} cannot be changed while running")
+    kind = type(getattr(Config, name))
+    if kind is bool:
+        if isinstance(value, str) and value.lower() in ('true', 'false', '1', '0', 'on', 'off'):
+            return value.lower() in ('true', '1', 'on')
+        if not isinstance(value, bool):
+            raise ValueError(f"{name} must be a boolean")
+        return value
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a number")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be {'an integer' if kind is int else 'a number'}")
+    if kind is int:
+        # 4.9 is a typo, not 4
+        if not number.is_integer():
+            raise ValueError(f"{name} must be an integer")
+        number = int(number)
+    low, high = SETTING_RANGES[name]
+    if not low <= number <= high:
+        raise ValueError(f"{name} must be between {low:g} and {high:g}, got {value}")
+    return number
+
+class ControlHandler(BaseHTTPRequestHandler):
+    """GET /status /metrics /config, POST /pause /resume /stop /rescan /config"""
+    server_version = 'wplace-legitbot'
+
+    def do_GET(self):
+        control = self.server.control
+        if not self.authorized():
+            return
+        path, _, query = self.path.partition('?')
+        if path == '/status':
+            self.reply(200, control.status())
+        elif path == '/metrics':
+            self.reply(200, control.metrics('format=json' not in query))
+        elif path == '/config':
+            self.reply(200, {name: getattr(control.bot.config, name) for name in CONTROL_SETTINGS})
+        else:
+            self.reply(404, {'error': f"unknown endpoint {path}"})
+
+    def do_POST(self):
+        control = self.server.control
+        if not self.authorized():
+            return
+        path = self.path.partition('?')[0]
+        if path == '/config':
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                changes = json.loads(self.rfile.read(length) or b'{}')
+                if not isinstance(changes, dict):
+                    raise ValueError("expected a JSON object")
+                applied = control.submit({name: coerce_setting(name, value) for name, value in changes.items()})
+            except ValueError as e:
+                self.reply(400, {'error': str(e)})
+                return
+            self.reply(200 if applied else 202, {'applied': applied, 'config': {name: getattr(control.bot.config, name) for name in changes}})
+            return
+        actions = {'/pause': control.pause, '/resume': control.resume, '/stop': control.request_stop, '/rescan': control.request_rescan}
+        if path not in actions:
+            self.reply(404, {'error': f"unknown endpoint {path}"})
+            return
+        actions[path]('api')
+        self.reply(200, control.status())
+
+    def authorized(self):
+        # Browsers always send Origin on cross-site requests; refuse them so no web page can drive the mouse
+        if self.headers.get('Origin'):
+            self.reply(403, {'error': 'cross-origin requests are refused'})
+            return False
+        token = self.server.control.bot.config.control_token
+        if token:
+            supplied = self.headers.get('Authorization', '')
+            if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+                self.reply(401, {'error': 'missing or wrong bearer token'})
+                return False
+        return True
+
+    def reply(self, code, payload):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload, indent=2).encode(), 'application/json'
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.control.bot.console.log(f"{Color.GRAY}🛰 {self.address_string()} {format % args}{Color.RESET}", LOG_DEBUG)
+
+class ControlPlane:
+    """Hotkey callbacks and an optional localhost HTTP API that steer a running bot"""
+    def __init__(self, bot):
+        self.bot = bot
+        self.paused = False
+        self.changed = threading.Event()
+        self.pending = deque()
+        self.hotkeys = []
+        self.polling = False
+        self.server = None
+        self.thread = None
+        self.pacer = None
+        self.worker = None
+
+    def start(self, pacer, worker=None):
+        config = self.bot.config
+        self.pacer = pacer
+        self.worker = worker
+        keys = [(key, callback) for key, callback in ((config.stop_key, self.request_stop), (config.pause_key, self.toggle_pause)) if key]
+        try:
+            for key, callback in keys:
+                self.hotkeys.append(keyboard.add_hotkey(key, callback, args=('hotkey',)))
+        except Exception as e:
+            # No keyboard hook (e.g. Linux without root): fall back to polling the stop key
+            self.bot.console.log(f"{Color.YELLOW}⚠ Hotkeys unavailable ({e}), polling '{config.stop_key}' instead{Color.RESET}")
+            self.polling = bool(config.stop_key)
+            if self.polling:
+                try:
+                    keyboard.is_pressed(config.stop_key)
+                except Exception:
+                    self.bot.console.log(f"{Color.YELLOW}⚠ No keyboard access, stop with Ctrl+C or the control API{Color.RESET}")
+                    self.polling = False
+        if config.control_port:
+            try:
+                self.server = ThreadingHTTPServer(('127.0.0.1', config.control_port), ControlHandler)
+            except OSError as e:
+                self.bot.console.log(f"{Color.RED}❌ Cannot start control API on port {config.control_port}: {e}{Color.RESET}", LOG_ERROR)
+                return
+            self.server.daemon_threads = True
+            self.server.control = self
+            self.thread = threading.Thread(target=self.server.serve_forever, args=(0.25,), name='control-api', daemon=True)
+            self.thread.start()
+            self.bot.console.log(f"{Color.GREEN}🛰 Control API on http://127.0.0.1:{self.server.server_address[1]}{Color.RESET}")
+
+    def stop(self):
+        for hotkey in self.hotkeys:
+            with contextlib.suppress(Exception):
+                keyboard.remove_hotkey(hotkey)
+        self.hotkeys = []
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def poll(self):
+        if self.polling and keyboard.is_pressed(self.bot.config.stop_key):
+            self.request_stop('hotkey')
+
+    def request_stop(self, origin='api'):
+        if self.bot.config.running:
+            self.bot.console.log(f"{Color.YELLOW}⏸ Stop requested ({origin})...{Color.RESET}", LOG_ERROR)
+        self.bot.config.running = False
+        self.changed.set()
+
+    def pause(self, origin='api'):
+        if not self.paused:
+            self.paused = True
+            self.bot.console.log(f"{Color.YELLOW}⏸ Paused ({origin}), press '{self.bot.config.pause_key}' or POST /resume to continue{Color.RESET}", LOG_ERROR)
+        self.changed.set()
+
+    def resume(self, origin='api'):
+        if self.paused:
+            self.paused = False
+            self.bot.console.log(f"{Color.GREEN}▶ Resumed ({origin}){Color.RESET}", LOG_ERROR)
+        self.changed.set()
+
+    def toggle_pause(self, origin='hotkey'):
+        if self.paused:
+            self.resume(origin)
+        else:
+            self.pause(origin)
+
+    def request_rescan(self, origin='api'):
+        self.bot.console.log(f"{Color.CYAN}📸 Rescan requested ({origin}){Color.RESET}")
+        self.bot.scheduler.request()
+        if self.worker is not None:
+            self.worker.request_scan()
+        self.changed.set()
+
+    def wait(self, timeout):
+        """Sleep while paused; returns early on any control action"""
+        self.changed.wait(timeout)
+        self.changed.clear()
+
+    def submit(self, changes, timeout=2.0):
+        """Queue validated settings for the clicker and wait until it applied them"""
+        done = threading.Event()
+        self.pending.append((changes, done))
+        self.changed.set()
+        return done.wait(timeout) if self.bot.config.running else False
+
+    def apply_pending(self):
+        """Apply queued settings unless a capture or scan is running; the scan worker applies them before its next one"""
+        if self.pending and self.bot.scan_lock.acquire(blocking=False):
+            try:
+                self.apply_changes()
+            finally:
+                self.bot.scan_lock.release()
+
+    def apply_changes(self):
+        """Apply queued settings; the caller holds bot.scan_lock so no capture or scan sees half a change"""
+        config = self.bot.config
+        while self.pending:
+            changes, done = self.pending.popleft()
+            for name, value in changes.items():
+                setattr(config, name, value)
+                self.bot.console.log(f"{Color.CYAN}🔧 {name} = {value}{Color.RESET}")
+            if GRID_SETTINGS & changes.keys():
+                # A manual grid overrides the cached calibration, or the next recheck would undo it
+                config.grid_calibrations[str(config.zoom_level)] = [config.pixel_size, config.grid_offset_x, config.grid_offset_y]
+                self.bot.calibration_misses = 0
+            elif 'zoom_level' in changes:
+                self.bot.apply_calibration()
+            if 'verbosity' in changes:
+                self.bot.console.verbosity = config.verbosity
+            done.set()
+
+    def metrics(self, prometheus=True):
+        if self.pacer is not None:
+            self.bot.update_gauges(self.pacer)
+        return self.bot.metrics.render(prometheus)
+
+    def status(self):
+        bot = self.bot
+        pacer = self.pacer
+        status = {'running': bot.config.running, 'paused': self.paused, 'queued': len(bot.small_pixels),
+                  'target_cps': bot.config.clicks_per_second, 'scan_interval': round(bot.scheduler.interval(), 3)}
+        if pacer is not None:
+            status.update(clicks=pacer.clicks, cps=round(pacer.recent_cps(), 2), average_cps=round(pacer.achieved_cps(), 2),
+                          lost_seconds={reason: round(seconds, 2) for reason, seconds in pacer.lost.items()})
+        if bot.verifier is not None:
+            status.update(confirmed=bot.verifier.confirmed, failed=bot.verifier.failed)
+        return status
+
+class WPlaceBot:
+    def __init__(self):
+        self.config = Config()
+        self.small_pixels = TargetQueue(self.config.requeue_cooldown)
+        self.metrics = Metrics()
+        self.console = Console(self.config.verbosity)
+        self.source = MssFrameSource()
+        self.source.metrics = self.metrics
+        self.input = PyAutoGuiBackend()
+        self.overlay = OverlayRenderer()
+        self.preview = None
+        self.geometry = None
+        self.scan_state = None
+        self.tiled_scanner = None
+        self.target = None
+        self.verifier = None
+        self.calibration_misses = 0
+        self.calibration_retry_at = 0.0
+        # Command-line values for this run only: setting -> (replaced, applied), see save_profile
+        self.run_overrides = {}
+        # Held across one capture, calibration re-check and scan; live setting changes wait for it
+        self.scan_lock = threading.Lock()
+        self.scheduler = ScanScheduler(self.config)
+        self.control = ControlPlane(self)
+
+    def override_setting(self, name, value):
+        """Apply a value for this run only; saved profiles keep the value it replaced"""
+        replaced = self.run_overrides.get(name, (getattr(self.config, name), None))[0]
+        self.run_overrides[name] = (replaced, value)
+        setattr(self.config, name, value)
+
+    def save_profile(self, name):
+        return save_profile(self.config, name, self.run_overrides)
+
+    def close(self):
+        self.source.close()
+        self.input.close()
+        if self.tiled_scanner is not None:
+            self.tiled_scanner.close()
+            self.tiled_scanner = None
+
+    def get_grid_geometry(self, image):
+        height, width = image.shape[:2]
+        return self.grid_geometry(width, height)
+
+    def grid_geometry(self, width, height):
+        key = (self.config.pixel_size, self.config.canvas_width, self.config.canvas_height, width, height,
+               self.config.grid_offset_x, self.config.grid_offset_y)
+        if self.geometry is None or self.geometry.key != key:
+            self.geometry = GridGeometry(*key)
+        return self.geometry
+
+    def target_grid(self, geometry):
+        """Target palette indices laid over the grid at the target offset, PALETTE_IGNORE elsewhere"""
+        config = self.config
+        if not config.target_path:
+            raise ValueError("the target detector needs a target image (Option 4)")
+        key = (config.target_path, os.path.getmtime(config.target_path),
+               config.target_offset_x, config.target_offset_y, geometry.key)
+        if self.target is None or self.target[0] != key:
+            indices = load_target_indices(config.target_path)
+            grid = np.full((geometry.grid_height, geometry.grid_width), PALETTE_IGNORE, dtype=np.uint8)
+            offset_x, offset_y = config.target_offset_x, config.target_offset_y
+            y0, x0 = max(0, offset_y), max(0, offset_x)
+            y1 = min(geometry.grid_height, offset_y + indices.shape[0])
+            x1 = min(geometry.grid_width, offset_x + indices.shape[1])
+            if y1 > y0 and x1 > x0:
+                grid[y0:y1, x0:x1] = indices[y0 - offset_y:y1 - offset_y, x0 - offset_x:x1 - offset_x]
+            self.target = (key, grid)
+        return self.target[1]
+
+    def analyze_cells(self, samples, target, min_color_variance):
+        if target is not None:
+            return analyze_target(samples[0], target)
+        return analyze_samples(samples, min_color_variance)
+
+    def get_tiled_scanner(self):
+        workers = self.config.scan_workers
+        if self.tiled_scanner is not None and self.tiled_scanner.workers != workers:
+            self.tiled_scanner.close()
+            self.tiled_scanner = None
+        if self.tiled_scanner is None and workers > 0:
+            self.tiled_scanner = TiledScanner(workers)
+        return self.tiled_scanner
+
+    def scan_grid_tiled(self, image, geometry):
+        min_color_variance = self.config.min_color_variance
+        with self.metrics.stage('tiles'):
+            has_nuances, scores = self.get_tiled_scanner().analyze(image, geometry, min_color_variance)
+        state = self.scan_state
+        settings = ('tiled', min_color_variance)
+        if (not self.config.incremental_scan or state is None or state.geometry is not geometry
+                or state.settings != settings):
+            self.scan_state = ScanState(geometry, settings, None, has_nuances, scores)
+            return geometry.valid.copy()
+        # Tiles are analyzed in full, a cell is dirty when its result changed
+        dirty = ((has_nuances != state.has_nuances) | (scores != state.scores)) & geometry.valid
+        state.has_nuances = has_nuances
+        state.scores = scores
+        state.samples = None
+        return dirty
+
+    def scan_grid_regions(self, image, geometry):
+        config = self.config
+        metrics = self.metrics
+        valid_y, valid_x = np.nonzero(geometry.valid)
+        with metrics.stage('regions'):
+            statistics = region_statistics(image, geometry, config.region_margin)
+        _, sums, squares, _ = statistics
+        # Region sums double as the change signature of a cell for incremental rescans
+        signature = np.concatenate([sums, squares[..., None]], axis=2)
+        state = self.scan_state
+        settings = ('region', config.min_color_variance, config.min_unique_colors, config.region_margin,
+                    config.color_quantization, config.min_color_pixels)
+        if (not config.incremental_scan or state is None or state.geometry is not geometry
+                or state.samples is None or state.settings != settings):
+            has_nuances = np.zeros((geometry.grid_height, geometry.grid_width), dtype=bool)
+            scores = np.zeros((geometry.grid_height, geometry.grid_width), dtype=np.float32)
+            with metrics.stage('analyze'):
+                has_nuances[valid_y, valid_x], scores[valid_y, valid_x] = analyze_regions(
+                    image, geometry, statistics, valid_y, valid_x, config)
+            self.scan_state = ScanState(geometry, settings, signature, has_nuances, scores)
+            return geometry.valid.copy()
+        with metrics.stage('diff'):
+            changed = np.any(signature != state.samples, axis=2)
+            # Valid cells are a leading block of the grid, the statistics only cover that block
+            dirty = np.zeros_like(geometry.valid)
+            dirty[:changed.shape[0], :changed.shape[1]] = changed
+            dirty &= geometry.valid
+            grid_y, grid_x = np.nonzero(dirty)
+        if len(grid_y):
+            with metrics.stage('analyze'):
+                has_nuances, scores = analyze_regions(image, geometry, statistics, grid_y, grid_x, config)
+            state.has_nuances[grid_y, grid_x] = has_nuances
+            state.scores[grid_y, grid_x] = scores
+        state.samples = signature
+        return dirty
+
+    def scan_grid(self, image):
+        metrics = self.metrics
+        with metrics.stage('gather'):
+            geometry = self.get_grid_geometry(image)
+            if self.config.detector == 'region':
+                samples = None
+            elif self.config.scan_workers > 0 and self.config.detector == 'points':
+                samples = None
+            else:
+                samples = geometry.gather(image)
+        if self.config.detector == 'region':
+            return self.scan_grid_regions(image, geometry)
+        if samples is None:
+            return self.scan_grid_tiled(image, geometry)
+        state = self.scan_state
+        min_color_variance = self.config.min_color_variance
+        target = self.target_grid(geometry) if self.config.detector == 'target' else None
+        settings = ('points', min_color_variance) if target is None else ('target', self.target[0])
+        if (not self.config.incremental_scan or state is None or state.geometry is not geometry
+                or state.samples is None or state.settings != settings):
+            with metrics.stage('analyze'):
+                has_nuances, scores = self.analyze_cells(samples, target, min_color_variance)
+            self.scan_state = ScanState(geometry, settings, samples, has_nuances, scores)
+            return geometry.valid.copy()
+        # A cell's result only depends on its five samples, so diffing them is the cell-level frame diff
+        with metrics.stage('diff'):
+            dirty = np.any(samples != state.samples, axis=(0, 3)) & geometry.valid
+            grid_y, grid_x = np.nonzero(dirty)
+        if len(grid_y):
+            with metrics.stage('analyze'):
+                cell_target = target[grid_y, grid_x] if target is not None else None
+                has_nuances, scores = self.analyze_cells(samples[:, grid_y, grid_x], cell_target, min_color_variance)
+            state.has_nuances[grid_y, grid_x] = has_nuances
+            state.scores[grid_y, grid_x] = scores
+        state.samples = samples
+        return dirty
+
+    def scan_frame(self, image):
+        scan_start = time.perf_counter()
+        previous_state = self.scan_state
+        dirty = self.scan_grid(image)
+        state = self.scan_state
+        tile_timings = list(self.tiled_scanner.timings) if self.config.scan_workers > 0 else None
+        duration = time.perf_counter() - scan_start
+        self.metrics.record('scan', duration)
+        return ScanResult(state.geometry, dirty, state.has_nuances.copy(), state.scores.copy(),
+                          state is not previous_state, duration, tile_timings)
+
+    def calibrate(self, image, announce=print):
+        """Full grid calibration for the current zoom level; returns the accepted GridCalibration or None"""
+        with self.metrics.stage('calibrate'):
+            calibration = calibrate_grid(image)
+        if calibration is None or calibration.confidence < CALIBRATION_MIN_CONFIDENCE:
+            confidence = f" (confidence {calibration.confidence:.2f})" if calibration else " (too few colored cells)"
+            self.calibration_retry_at = time.monotonic() + CALIBRATION_RETRY_SECONDS
+            announce(f"{Color.YELLOW}⚠ Grid calibration failed{confidence}, keeping pixel size {self.config.pixel_size:.4f} px{Color.RESET}")
+            return None
+        self.config.grid_calibrations[str(self.config.zoom_level)] = [
+            calibration.pixel_size, calibration.offset_x, calibration.offset_y]
+        self.apply_calibration()
+        announce(f"{Color.GREEN}✓ Grid calibrated at zoom {self.config.zoom_level}: pixel size {calibration.pixel_size:.4f} px, "
+                 f"offset ({calibration.offset_x:.2f}, {calibration.offset_y:.2f}), confidence {calibration.confidence:.2f}{Color.RESET}")
+        return calibration
+
+    def apply_calibration(self):
+        """Use the cached calibration of the current zoom level, if any"""
+        cached = self.config.grid_calibrations.get(str(self.config.zoom_level))
+        if cached is None:
+            return False
+        self.config.pixel_size, self.config.grid_offset_x, self.config.grid_offset_y = cached
+        return True
+
+    def recheck_calibration(self, image):
+        """Correct a drifted grid offset, or recalibrate when the grid no longer fits at all"""
+        config = self.config
+        can_calibrate = not isinstance(image, SparseFrame) and time.monotonic() >= self.calibration_retry_at
+        if not self.apply_calibration():
+            if can_calibrate:
+                self.calibrate(image, self.console.log)
+            return
+        with self.metrics.stage('calibrate'):
+            checked = check_calibration(image, config.pixel_size, config.grid_offset_x, config.grid_offset_y)
+        coherences = [coherence for _, coherence in checked if coherence is not None]
+        # Too few edges (a mostly blank canvas) says nothing about the grid, keep it and the miss count
+        if coherences:
+            lost = max(coherences) < CALIBRATION_LOST_COHERENCE
+            self.calibration_misses = self.calibration_misses + 1 if lost else 0
+        if self.calibration_misses >= CALIBRATION_LOST_CHECKS and can_calibrate:
+            self.calibration_misses = 0
+            self.console.log(f"{Color.YELLOW}⚠ Grid no longer matches the canvas, recalibrating...{Color.RESET}")
+            self.calibrate(image, self.console.log)
+            return
+        offsets = [config.grid_offset_x, config.grid_offset_y]
+        pixel_size = config.pixel_size
+        for axis, (offset, coherence) in enumerate(checked):
+            if coherence is None or coherence < CALIBRATION_MIN_CONFIDENCE:
+                continue
+            drift = (offset - offsets[axis] + pixel_size / 2) % pixel_size - pixel_size / 2
+            if abs(drift) > config.calibration_tolerance:
+                offsets[axis] = offset
+        if offsets != [config.grid_offset_x, config.grid_offset_y]:
+            self.console.log(f"{Color.YELLOW}↔ Canvas drifted, grid offset ({config.grid_offset_x:.2f}, {config.grid_offset_y:.2f}) -> "
+                             f"({offsets[0]:.2f}, {offsets[1]:.2f}){Color.RESET}")
+            config.grid_calibrations[str(config.zoom_level)] = [pixel_size] + offsets
+            config.grid_offset_x, config.grid_offset_y = offsets
+
+    def capture_and_scan(self, source=None):
+        """One capture plus scan; returns None once the frame source is exhausted"""
+        path = self.config.profile_scan_path
+        profiler = None
+        if path:
+            self.config.profile_scan_path = ''
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            with self.scan_lock:
+                self.control.apply_changes()
+                # The region detector reads every pixel of a cell, sparse frames only hold sample rows,
+                # and a first calibration needs a full frame too
+                sparse = self.config.sparse_capture and self.config.detector != 'region'
+                if self.config.auto_calibrate and str(self.config.zoom_level) not in self.config.grid_calibrations:
+                    sparse = False
+                image = self.capture_canvas(source, sparse)
+                if image is None:
+                    return None
+                if self.config.auto_calibrate:
+                    self.recheck_calibration(image)
+                    if isinstance(image, SparseFrame) and not self.get_grid_geometry(image).fits(image):
+                        # A corrected grid offset moves the sample rows, capture the new ones
+                        image = self.capture_canvas(source, True)
+                        if image is None:
+                            return None
+                result = self.scan_frame(image)
+            if self.preview is not None:
+                self.preview.offer(image, result)
+            return result
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(path)
+                self.console.log(f"{Color.GRAY}💾 Scan profile written to {path} (pstats, e.g. snakeviz or flameprof){Color.RESET}")
+
+    def apply_scan(self, result):
+        geometry = result.geometry
+        queue = self.small_pixels
+        queue.cooldown = self.config.requeue_cooldown
+        scores = result.scores.ravel()
+        with self.metrics.stage('queue'):
+            if queue.geometry is not geometry:
+                queue.reset(geometry)
+            if result.full or not queue:
+                cells = np.flatnonzero(result.has_nuances & geometry.valid)
+                queue.rebuild(cells, scores[cells])
+            elif result.dirty.any():
+                cells = np.flatnonzero(result.dirty)
+                queue.update(cells, scores[cells], result.has_nuances.ravel()[cells])
+        changed = int(np.count_nonzero(result.dirty))
+        self.console.log(f"{Color.GREEN}✓ {changed} changed cells re-analyzed in {result.duration*1000:.0f}ms - {len(queue)} small pixels queued{Color.RESET}")
+        if result.tile_timings:
+            self.print_tile_timings(result.tile_timings, result.duration, detailed=False)
+
+    def print_tile_timings(self, tile_timings, duration, detailed=True):
+        elapsed = [seconds for _, seconds in tile_timings]
+        busy = sum(elapsed)
+        self.console.log(f"{Color.GRAY}  {len(elapsed)} tiles on {self.config.scan_workers} workers: "
+                         f"slowest {max(elapsed)*1000:.1f}ms, mean {busy/len(elapsed)*1000:.1f}ms, "
+                         f"parallel efficiency {busy / max(duration * self.config.scan_workers, 1e-9) * 100:.0f}%{Color.RESET}")
+        if detailed:
+            for (x0, y0, x1, y1), seconds in tile_timings:
+                self.console.log(f"{Color.GRAY}    Tile grid ({x0},{y0})-({x1},{y1}): {seconds*1000:.1f}ms{Color.RESET}")
+
+    def rescan(self, image):
+        self.apply_scan(self.scan_frame(image))
+
+    def targets_from_grid(self, geometry, has_nuances, scores):
+        grid_y, grid_x = np.nonzero(has_nuances & geometry.valid)
+        cell_scores = scores[grid_y, grid_x]
+        order = np.argsort(-cell_scores, kind='stable')
+        grid_x = grid_x[order]
+        grid_y = grid_y[order]
+        return list(zip(geometry.centers_x[grid_x].tolist(), geometry.centers_y[grid_y].tolist(),
+                        cell_scores[order].tolist(), grid_x.tolist(), grid_y.tolist()))
 
     def configure_canvas(self):
         print(f"\n{fade('=== Canvas area configuration ===')}")
@@ -81,19 +2573,132 @@ class WPlaceBot:
         grid_height = int(self.config.canvas_height / self.config.pixel_size)
         print(f"{Color.GREEN}✓ Estimated grid: {grid_width}x{grid_height} wplace pixels{Color.RESET}")
         print(f"{Color.GREEN}✓ Pixel size: {self.config.pixel_size:.2f} px{Color.RESET}")
+        if self.config.auto_calibrate and self.source.live:
+            print(f"\n{Color.CYAN}📐 Calibrating grid at zoom {self.config.zoom_level}...{Color.RESET}")
+            image = self.capture_canvas()
+            if image is not None:
+                self.calibrate(image)
         print(f"\n{fade('Configuration done!')}\n")
 
-    def capture_canvas(self):
-        monitor = {
-            "top": self.config.canvas_top_left_y,
-            "left": self.config.canvas_top_left_x,
-            "width": self.config.canvas_width,
-            "height": self.config.canvas_height
-        }
-        screenshot = self.sct.grab(monitor)
-        img = np.array(screenshot)
-        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-        return img
+    def manage_profiles(self):
+        print(f"\n{fade('=== Profiles ===')}")
+        names = list_profiles()
+        print(f"{Color.GRAY}Saved in {PROFILE_DIR}: {', '.join(names) if names else 'none'}{Color.RESET}")
+        print(f"{Color.GRAY}Current: {self.config.profile or 'none'}{Color.RESET}")
+        action = input(f"{Color.CYAN}(s)ave current settings or (l)oad a profile? {Color.RESET}").strip().lower()
+        if action == 's':
+            name = input(f"{Color.CYAN}Profile name [{self.config.profile}]: {Color.RESET}").strip() or self.config.profile
+            path = self.save_profile(name)
+            self.config.profile = name
+            print(f"{Color.GREEN}✓ Saved to {path}{Color.RESET}")
+        elif action == 'l':
+            name = input(f"{Color.CYAN}Profile name: {Color.RESET}").strip()
+            self.use_profile(name)
+            print(f"{Color.GREEN}✓ Profile '{name}' loaded: canvas {self.config.canvas_width}x{self.config.canvas_height} at "
+                  f"({self.config.canvas_top_left_x}, {self.config.canvas_top_left_y}), pixel size {self.config.pixel_size:.4f} px, "
+                  f"{self.config.clicks_per_second:g} CPS{Color.RESET}")
+
+    def configure_frame_source(self):
+        previous = copy.copy(self.config)
+        try:
+            self.select_frame_source()
+        except Exception:
+            self.config = previous
+            raise
+
+    def select_frame_source(self):
+        print(f"\n{fade('=== Frame source ===')}")
+        kinds = list(FRAME_SOURCES)
+        for i, kind in enumerate(kinds, 1):
+            marker = f" {Color.GREEN}(current){Color.RESET}" if kind == self.config.frame_source else ""
+            print(f"{Color.GREEN}{i}.{Color.RESET} {FRAME_SOURCES[kind]}{marker}")
+        choice = input(f"{Color.CYAN}Source [{kinds.index(self.config.frame_source) + 1}]: {Color.RESET}").strip()
+        if choice:
+            self.config.frame_source = kinds[int(choice) - 1]
+        if self.config.frame_source != 'screen':
+            path = input(f"{Color.CYAN}Path [{self.config.source_path}]: {Color.RESET}").strip()
+            if path:
+                self.config.source_path = path
+            speed = input(f"{Color.CYAN}Replay speed, 0 = unthrottled [{self.config.replay_speed}]: {Color.RESET}").strip()
+            if speed:
+                self.config.replay_speed = float(speed)
+            loop = input(f"{Color.CYAN}Loop when finished? (y/n) [{'y' if self.config.replay_loop else 'n'}]: {Color.RESET}").strip().lower()
+            if loop:
+                self.config.replay_loop = loop == 'y'
+        record = input(f"{Color.CYAN}Record frames to directory, '-' = off [{self.config.record_path}]: {Color.RESET}").strip()
+        if record:
+            self.config.record_path = '' if record == '-' else record
+        self.set_frame_source(create_frame_source(self.config))
+        print(f"{Color.GREEN}✓ Frame source: {FRAME_SOURCES[self.config.frame_source]}{Color.RESET}")
+        if not self.source.live:
+            print(f"{Color.GREEN}✓ Canvas: {self.config.canvas_width}x{self.config.canvas_height} px{Color.RESET}")
+        if self.config.record_path:
+            print(f"{Color.GREEN}✓ Recording to: {self.config.record_path}{Color.RESET}")
+
+    def canvas_configured(self):
+        return not (self.source.live and self.config.canvas_width == 1000 and self.config.canvas_top_left_x == 0)
+
+    def use_profile(self, name):
+        load_profile(self.config, name)
+        if self.config.frame_source != 'screen':
+            self.set_frame_source(create_frame_source(self.config))
+        self.set_input_backend(create_input_backend(self.config))
+
+    def save_snapshot(self):
+        """Persist the queued targets with their grid so the next run of this profile can click before its first scan"""
+        queue = self.small_pixels
+        if not self.config.profile or queue.geometry is None:
+            return
+        cells = np.frombuffer(queue.heap, dtype=np.int64)
+        scores = np.frombuffer(queue.priority, dtype=np.float32)[cells]
+        path = profile_path(self.config.profile, '.snapshot.npz')
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, key=np.array(queue.geometry.key, dtype=np.float64), cells=cells, scores=scores,
+                     canvas=np.array([self.config.canvas_top_left_x, self.config.canvas_top_left_y]), saved_at=time.time())
+        os.replace(temp_path, path)
+
+    def restore_snapshot(self):
+        """Queue the targets of the last run when it used the same canvas and grid and is recent enough"""
+        config = self.config
+        try:
+            with np.load(profile_path(config.profile, '.snapshot.npz')) as snapshot:
+                key = tuple(snapshot['key'].tolist())
+                canvas = snapshot['canvas'].tolist()
+                age = time.time() - float(snapshot['saved_at'])
+                cells, scores = snapshot['cells'], snapshot['scores']
+        except (OSError, KeyError, ValueError):
+            return 0
+        expected = (config.pixel_size, config.canvas_width, config.canvas_height, config.grid_offset_x, config.grid_offset_y)
+        if age > config.snapshot_max_age or canvas != [config.canvas_top_left_x, config.canvas_top_left_y] or key[:3] + key[5:] != expected:
+            return 0
+        width, height = int(key[3]), int(key[4])
+        geometry = self.grid_geometry(width, height)
+        # Reusing the geometry object keeps click cooldowns when the first live scan replaces these targets
+        self.small_pixels.reset(geometry)
+        self.small_pixels.rebuild(cells, scores)
+        self.console.log(f"{Color.GREEN}♻ Warm start: {len(self.small_pixels)} targets from a {age:.0f}s old snapshot{Color.RESET}")
+        return len(self.small_pixels)
+
+    def set_input_backend(self, backend):
+        self.input.close()
+        self.input = backend
+
+    def set_frame_source(self, source):
+        self.source.close()
+        self.source = source
+        source.metrics = self.metrics
+        size = source.frame_size()
+        if not source.live and size is not None:
+            self.config.canvas_width, self.config.canvas_height = size
+
+    def capture_canvas(self, source=None, sparse=False):
+        source = source or self.source
+        with self.metrics.stage('capture'):
+            if sparse:
+                geometry = self.grid_geometry(self.config.canvas_width, self.config.canvas_height)
+                return source.read_rows(self.config, geometry.sample_rows)
+            return source.read(self.config)
 
     def get_pixel_region_at_position(self, image, canvas_x, canvas_y):
         x_start = int(canvas_x)
@@ -137,109 +2742,222 @@ class WPlaceBot:
         pixel_size = self.config.pixel_size
         print(f"{Color.GRAY}Pixel size: {pixel_size:.4f} px ({452}/{11}){Color.RESET}")
         print(f"{Color.GRAY}Canvas: {self.config.canvas_width}x{self.config.canvas_height} px{Color.RESET}")
+        print(f"{Color.GRAY}Detector: {self.config.detector}{Color.RESET}")
         print(f"{Color.GRAY}Unique color threshold: {self.config.min_unique_colors}{Color.RESET}")
         print(f"{Color.GRAY}Min variance: {self.config.min_color_variance}{Color.RESET}")
-        small_pixels = []
-        checked_count = 0
-        grid_width = int(self.config.canvas_width / pixel_size)
-        grid_height = int(self.config.canvas_height / pixel_size)
-        print(f"{Color.GRAY}Grid: {grid_width}x{grid_height} wplace pixels{Color.RESET}")
+        geometry = self.get_grid_geometry(image)
+        print(f"{Color.GRAY}Grid: {geometry.grid_width}x{geometry.grid_height} wplace pixels{Color.RESET}")
         print(f"{Color.GRAY}Scanning grid with step {pixel_size:.4f} px...{Color.RESET}")
-        last_progress = 0
-        canvas_y = 0.0
-        grid_y = 0
-        while canvas_y + pixel_size <= self.config.canvas_height:
-            canvas_x = 0.0
-            grid_x = 0
-            while canvas_x + pixel_size <= self.config.canvas_width:
-                region = self.get_pixel_region_at_position(image, canvas_x, canvas_y)
-                if region is not None:
-                    has_nuances, score = self.analyze_pixel_region(region)
-                    checked_count += 1
-                    if has_nuances:
-                        center_x = canvas_x + pixel_size / 2
-                        center_y = canvas_y + pixel_size / 2
-                        small_pixels.append((center_x, center_y, score, grid_x, grid_y))
-                canvas_x += pixel_size
-                grid_x += 1
-            progress = int((grid_y / grid_height) * 100)
-            if progress >= last_progress + 10:
-                print(f"{Color.YELLOW}  Progress: {progress}% ({len(small_pixels)} small pixels found){Color.RESET}")
-                last_progress = progress
-            canvas_y += pixel_size
-            grid_y += 1
+        scan_start = time.perf_counter()
+        self.scan_grid(image)
+        scan_time = time.perf_counter() - scan_start
+        with self.metrics.stage('sort'):
+            small_pixels = self.targets_from_grid(geometry, self.scan_state.has_nuances, self.scan_state.scores)
+        checked_count = int(np.count_nonzero(geometry.valid))
         print(f"{Color.GREEN}✓ {len(small_pixels)} small pixels detected ({checked_count} checked){Color.RESET}")
-        small_pixels.sort(key=lambda x: x[2], reverse=True)
+        if self.config.scan_workers > 0:
+            self.print_tile_timings(self.tiled_scanner.timings, scan_time)
         return small_pixels
 
-    def teleport_mouse(self, x, y):
-        pyautogui.moveTo(x, y, duration=0)
-
-    def click_instantly(self):
-        pyautogui.click()
-
     def calculate_click_delay(self):
         return 1.0 / self.config.clicks_per_second
 
     def click_at_canvas_position(self, canvas_x, canvas_y):
         screen_x = self.config.canvas_top_left_x + canvas_x
         screen_y = self.config.canvas_top_left_y + canvas_y
-        self.teleport_mouse(screen_x, screen_y)
-        self.click_instantly()
+        with self.metrics.stage('click'):
+            self.input.click_at(screen_x, screen_y)
         return True
 
     def run_smart_clicker(self):
         print(f"\n{fade('=== Smart bot started (Teleport mode) ===')}")
         print(f"{Color.GREEN}CPS: {self.config.clicks_per_second} clicks/sec{Color.RESET}")
         print(f"{Color.GREEN}Delay between clicks: {self.calculate_click_delay():.3f}s{Color.RESET}")
-        print(f"{Color.YELLOW}Press 'q' to stop{Color.RESET}\n")
+        print(f"{Color.YELLOW}Press '{self.config.stop_key}' to stop, '{self.config.pause_key}' to pause/resume{Color.RESET}\n")
         self.config.running = True
         click_count = 0
-        last_scan = 0
+        worker = None
+        waiting = False
+        pacer = ClickPacer(self.config.clicks_per_second, self.config.click_burst)
+        scheduler = self.scheduler = ScanScheduler(self.config)
+        scheduler.click_rate = lambda: pacer.recent_cps() or self.config.clicks_per_second
+        scheduler.queue_depth = lambda: len(self.small_pixels)
+        last_stats = time.perf_counter()
+        last_export = last_stats
+        console = self.console
+        self.verifier = ClickVerifier(self) if self.config.verify_clicks and self.source.live else None
+        verifier = self.verifier
+        control = self.control = ControlPlane(self)
+        try:
+            console.start(self.config.verbosity, self.config.log_file, self.config.status_refresh,
+                          self.config.console_buffer, lambda: self.status_line(pacer))
+        except OSError as e:
+            print(f"{Color.RED}❌ Cannot open log file: {e}{Color.RESET}")
+            console.start(self.config.verbosity, '', self.config.status_refresh,
+                          self.config.console_buffer, lambda: self.status_line(pacer))
         try:
+            if self.config.profile and self.config.warm_start and self.config.background_scan and self.source.live and not self.small_pixels:
+                # Click the previous run's targets while the background worker takes the first live scan
+                self.restore_snapshot()
+            self.input.prepare()
+            if self.config.preview:
+                if self.config.sparse_capture:
+                    console.log(f"{Color.YELLOW}⚠ Preview only shows full captures, sparse scans are skipped{Color.RESET}")
+                self.preview = LivePreview(self, self.config.preview, self.config.preview_fps, self.config.preview_scale)
+                self.preview.start()
+            if self.config.background_scan:
+                console.log(f"{Color.CYAN}📸 Capturing and analyzing canvas in the background...{Color.RESET}")
+                worker = ScanWorker(self)
+                worker.start()
+            control.start(pacer, worker)
             while self.config.running:
-                if keyboard.is_pressed('q'):
-                    print(f"\n{Color.YELLOW}⏸ Stop requested...{Color.RESET}")
-                    break
-                current_time = time.time()
-                if current_time - last_scan > self.config.scan_interval or not self.small_pixels:
-                    print(f"\n{Color.CYAN}📸 Capturing and analyzing canvas...{Color.RESET}")
-                    image = self.capture_canvas()
-                    self.small_pixels = self.detect_small_pixels(image)
-                    last_scan = current_time
+                control.poll()
+                control.apply_pending()
+                if control.paused:
+                    pause_start = time.perf_counter()
+                    control.wait(0.25)
+                    pacer.idle(time.perf_counter() - pause_start, 'paused')
+                    continue
+                if worker is not None:
+                    result = worker.take()
+                    if result is not None:
+                        self.apply_scan(result)
+                    elif worker.error is not None:
+                        raise worker.error
+                    elif worker.exhausted and not self.small_pixels:
+                        console.log(f"{Color.YELLOW}⏹ Frame source exhausted{Color.RESET}", LOG_ERROR)
+                        break
+                elif scheduler.remaining() <= 0 or (not self.source.live and not self.small_pixels):
+                    console.log(f"{Color.CYAN}📸 Capturing and analyzing canvas...{Color.RESET}", LOG_DEBUG)
+                    scan_start = time.perf_counter()
+                    result = self.capture_and_scan()
+                    if result is None:
+                        console.log(f"{Color.YELLOW}⏹ Frame source exhausted{Color.RESET}", LOG_ERROR)
+                        break
+                    scheduler.observe(result, time.perf_counter() - scan_start)
+                    self.apply_scan(result)
+                    pacer.idle(time.perf_counter() - scan_start, 'scan')
                 if self.small_pixels:
-                    pixel = self.small_pixels.pop(0)
+                    waiting = False
+                    pixel = self.small_pixels.pop()
                     canvas_x, canvas_y, score, grid_x, grid_y = pixel
-                    print(f"{Color.CYAN}⚡ Teleporting to grid pixel ({grid_x},{grid_y}), score: {score:.1f}{Color.RESET}")
-                    click_start = time.time()
+                    console.log(f"{Color.CYAN}⚡ Teleporting to grid pixel ({grid_x},{grid_y}), score: {score:.1f}{Color.RESET}", LOG_DEBUG)
+                    pacer.set_rate(self.config.clicks_per_second, self.config.click_burst)
+                    pacer.wait()
+                    click_start = time.perf_counter()
                     self.click_at_canvas_position(canvas_x, canvas_y)
-                    click_time = time.time() - click_start
+                    click_time = time.perf_counter() - click_start
+                    pacer.clicked()
                     click_count += 1
-                    print(f"{Color.GREEN}✓ Click #{click_count} in {click_time*1000:.1f}ms - {len(self.small_pixels)} left{Color.RESET}")
-                    delay = self.calculate_click_delay()
-                    time.sleep(max(0, delay - click_time))
+                    if verifier is not None:
+                        verifier.clicked(self.small_pixels.geometry, grid_x, grid_y)
+                    console.log(f"{Color.GREEN}✓ Click #{click_count} in {click_time*1000:.1f}ms - {len(self.small_pixels)} left{Color.RESET}", LOG_DEBUG)
                 else:
-                    print(f"{Color.YELLOW}⏳ No small pixel, waiting for next scan...{Color.RESET}")
-                    time.sleep(2)
+                    if not waiting:
+                        console.log(f"{Color.YELLOW}⏳ No small pixel, waiting for next scan...{Color.RESET}")
+                        waiting = True
+                    # Short waits keep verification retries and stop requests responsive
+                    wait_start = time.perf_counter()
+                    timeout = min(max(scheduler.remaining(), 0.01), 0.25)
+                    if worker is not None:
+                        worker.wait(timeout)
+                    else:
+                        time.sleep(timeout)
+                    pacer.idle(time.perf_counter() - wait_start)
+                if verifier is not None:
+                    verify_start = time.perf_counter()
+                    if verifier.run(self.source):
+                        pacer.idle(time.perf_counter() - verify_start, 'verify')
+                if time.perf_counter() - last_stats >= self.config.stats_interval:
+                    last_stats = time.perf_counter()
+                    console.log(f"{Color.GRAY}📊 {pacer.status(self.config.clicks_per_second)}{Color.RESET}")
+                    if verifier is not None:
+                        console.log(f"{Color.GRAY}🔎 {verifier.status()}{Color.RESET}")
+                    console.log(f"{Color.GRAY}🗓 {scheduler.status()}{Color.RESET}")
+                    console.log(f"{Color.GRAY}⏱ {self.metrics.status_line()}{Color.RESET}")
+                if self.config.metrics_file and time.perf_counter() - last_export >= self.config.metrics_interval:
+                    last_export = time.perf_counter()
+                    self.export_metrics(pacer)
         except KeyboardInterrupt:
-            print(f"\n{Color.YELLOW}⏸ Keyboard interrupt{Color.RESET}")
+            console.log(f"{Color.YELLOW}⏸ Keyboard interrupt{Color.RESET}", LOG_ERROR)
         except Exception as e:
-            print(f"\n{Color.RED}❌ Error: {e}{Color.RESET}")
+            console.log(f"{Color.RED}❌ Error: {e}{Color.RESET}", LOG_ERROR)
             import traceback
-            traceback.print_exc()
+            console.log(traceback.format_exc().rstrip(), LOG_ERROR)
         finally:
             self.config.running = False
+            control.stop()
+            if worker is not None:
+                worker.stop()
+            if self.preview is not None:
+                self.preview.stop()
+                if self.preview.target != 'window' and self.preview.frames:
+                    console.log(f"{Color.GREEN}🎞 {self.preview.frames} preview frames written to {self.preview.target}{Color.RESET}")
+                self.preview = None
+            console.stop()
             print(f"\n{fade('=== Bot stopped ===')}")
             print(f"{Color.GREEN}Total clicks: {click_count}{Color.RESET}")
             if click_count > 0:
-                print(f"{Color.GREEN}Average CPS: {self.config.clicks_per_second:.2f}{Color.RESET}")
+                p50, p95, p99 = pacer.jitter_percentiles()
+                print(f"{Color.GREEN}Average CPS: {pacer.achieved_cps():.2f} (target {self.config.clicks_per_second:g}){Color.RESET}")
+                print(f"{Color.GREEN}Click jitter p50/p95/p99: {p50*1000:.1f}/{p95*1000:.1f}/{p99*1000:.1f}ms{Color.RESET}")
+                print(f"{Color.GREEN}Time lost to scans: {pacer.lost['scan']:.1f}s, waiting for targets: {pacer.lost['waiting']:.1f}s{Color.RESET}")
+                print(f"{Color.GREEN}Stage latency {self.metrics.status_line()}{Color.RESET}")
+                if verifier is not None:
+                    print(f"{Color.GREEN}Verification: {verifier.status()}{Color.RESET}")
+            if self.config.metrics_file:
+                self.export_metrics(pacer)
+            if self.config.profile:
+                try:
+                    self.save_profile(self.config.profile)
+                    self.save_snapshot()
+                    print(f"{Color.GREEN}💾 Profile '{self.config.profile}' and {len(self.small_pixels)} queued targets saved{Color.RESET}")
+                except OSError as e:
+                    print(f"{Color.RED}❌ Cannot save profile: {e}{Color.RESET}")
+
+    def status_line(self, pacer):
+        """Live one-line summary, evaluated by the console writer thread"""
+        paused = " | PAUSED" if self.control.paused else ""
+        return (f"{Color.CYAN}⚡ {pacer.clicks} clicks | {pacer.recent_cps():.1f}/{self.config.clicks_per_second:g} CPS | "
+                f"{len(self.small_pixels)} queued{paused}{Color.RESET}")
+
+    def update_gauges(self, pacer):
+        p50, p95, p99 = pacer.jitter_percentiles()
+        self.metrics.set_gauge('clicks_total', pacer.clicks)
+        self.metrics.set_gauge('clicks_per_second', round(pacer.achieved_cps(), 3))
+        self.metrics.set_gauge('click_jitter_p99_seconds', round(float(p99), 6))
+        self.metrics.set_gauge('scan_lost_seconds', round(pacer.lost['scan'], 3))
+        self.metrics.set_gauge('queue_depth', len(self.small_pixels))
+        self.metrics.set_gauge('scan_interval_seconds', round(self.scheduler.interval(), 3))
+        if self.verifier is not None:
+            self.metrics.set_gauge('clicks_confirmed_total', self.verifier.confirmed)
+            self.metrics.set_gauge('clicks_failed_total', self.verifier.failed)
+
+    def export_metrics(self, pacer):
+        self.update_gauges(pacer)
+        try:
+            self.metrics.export(self.config.metrics_file)
+        except OSError as e:
+            self.console.log(f"{Color.RED}❌ Cannot write metrics: {e}{Color.RESET}", LOG_ERROR)
+
+    def render_detection_overlay(self, image, small_pixels):
+        return self.overlay.render(image, self.config, small_pixels)
 
     def test_detection(self):
         print(f"\n{Color.CYAN}📸 Capturing canvas...{Color.RESET}")
-        for i in range(3, 0, -1):
-            print(f"{Color.YELLOW}Starting in {i}...{Color.RESET}")
-            time.sleep(1)
+        if self.source.live:
+            for i in range(3, 0, -1):
+                print(f"{Color.YELLOW}Starting in {i}...{Color.RESET}")
+                time.sleep(1)
         image = self.capture_canvas()
+        if image is None:
+            print(f"{Color.RED}❌ Frame source has no frames left{Color.RESET}")
+            return
+        if image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        if self.config.auto_calibrate:
+            print(f"\n{Color.CYAN}📐 Calibrating grid at zoom {self.config.zoom_level}...{Color.RESET}")
+            self.calibrate(image)
         print(f"\n{Color.CYAN}🎯 Test on some positions...{Color.RESET}")
         pixel_size = self.config.pixel_size
         test_positions = [
@@ -271,24 +2989,7 @@ class WPlaceBot:
             print(f"\n{Color.GREEN}Top 20 nuanced pixels:{Color.RESET}")
             for i, (x, y, score, gx, gy) in enumerate(small_pixels[:20]):
                 print(f"{Color.GRAY}  {i+1}. Grid ({gx},{gy}), Score: {score:.2f}{Color.RESET}")
-        vis_image = image.copy()
-        x = 0.0
-        while x < self.config.canvas_width:
-            cv2.line(vis_image, (int(x), 0), (int(x), self.config.canvas_height), (200, 200, 200), 1)
-            x += pixel_size
-        y = 0.0
-        while y < self.config.canvas_height:
-            cv2.line(vis_image, (0, int(y)), (self.config.canvas_width, int(y)), (200, 200, 200), 1)
-            y += pixel_size
-        for x, y, score, gx, gy in small_pixels:
-            intensity = min(255, int(score * 20))
-            color = (0, 0, intensity)
-            cv2.circle(vis_image, (int(x), int(y)), 6, color, 2)
-            idx = small_pixels.index((x, y, score, gx, gy))
-            if idx < 30:
-                cv2.putText(vis_image, f"{idx+1}",
-                            (int(x)+8, int(y)+8), cv2.FONT_HERSHEY_SIMPLEX,
-                            0.5, (0, 255, 0), 2)
+        vis_image = self.render_detection_overlay(image, small_pixels)
         cv2.imwrite('canvas_capture.png', image)
         cv2.imwrite('canvas_detection.png', vis_image)
         print(f"\n{Color.GREEN}💾 Images saved:{Color.RESET}")
@@ -298,6 +2999,406 @@ class WPlaceBot:
         print(f"{Color.GRAY}  - Red circles = nuanced pixels (intensity = score){Color.RESET}")
         print(f"{Color.GRAY}  - Green numbers = top 30{Color.RESET}")
 
+def make_synthetic_canvas(config, nuanced_fraction=0.2, noise=0.0, seed=0):
+    """Solid-color grid cells at config.pixel_size; nuanced cells are recolored from their right sample column on"""
+    rng = np.random.default_rng(seed)
+    width, height = config.canvas_width, config.canvas_height
+    geometry = GridGeometry(config.pixel_size, width, height, width, height)
+    grid_width, grid_height = max(geometry.grid_width, 1), max(geometry.grid_height, 1)
+    starts_x = (geometry.centers_x - config.pixel_size / 2).astype(int) if geometry.grid_width else np.zeros(1, dtype=int)
+    starts_y = (geometry.centers_y - config.pixel_size / 2).astype(int) if geometry.grid_height else np.zeros(1, dtype=int)
+    col_cell = np.clip(np.searchsorted(starts_x, np.arange(width), side='right') - 1, 0, grid_width - 1)
+    row_cell = np.clip(np.searchsorted(starts_y, np.arange(height), side='right') - 1, 0, grid_height - 1)
+    palette = rng.integers(0, 256, (32, 3)).astype(np.uint8)
+    base = rng.integers(0, len(palette), (grid_height, grid_width))
+    accent = (base + rng.integers(1, len(palette), (grid_height, grid_width))) % len(palette)
+    nuanced = rng.random((grid_height, grid_width)) < nuanced_fraction
+    # Start the accent at the right sample itself, a fixed fraction of the cell misses it on small cells
+    right_x = geometry.cols[1, 0] if geometry.grid_width else np.zeros(1, dtype=np.intp)
+    right_part = np.arange(width) >= right_x[col_cell]
+    colors = np.where(nuanced[row_cell][:, col_cell] & right_part[None, :],
+                      accent[row_cell][:, col_cell], base[row_cell][:, col_cell])
+    image = palette[colors]
+    if noise > 0:
+        image = np.clip(image + rng.normal(0, noise, image.shape), 0, 255).astype(np.uint8)
+    return image
+
+def time_stage(function, repeats, warmup=1):
+    for _ in range(warmup):
+        function()
+    durations = []
+    result = None
+    for _ in range(repeats):
+        stage_start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - stage_start)
+    return durations, result
+
+def benchmark_click_loop(bot, clicks_per_second, seconds):
+    """Run the real click loop against a RecordingBackend for `seconds`; returns the inter-click intervals"""
+    config = bot.config
+    config.clicks_per_second = clicks_per_second
+    # Every scan is a full one and nothing cools down, so a rescan refills the queue whenever it runs dry
+    config.incremental_scan = False
+    config.requeue_cooldown = 0.0
+    config.background_scan = False
+    config.stop_key = config.pause_key = ''
+    config.verbosity = LOG_ERROR
+    backend = RecordingBackend()
+    bot.set_input_backend(backend)
+    timer = threading.Timer(seconds, lambda: setattr(config, 'running', False))
+    timer.start()
+    try:
+        bot.run_smart_clicker()
+    finally:
+        timer.cancel()
+    return list(backend.intervals())
+
+def run_benchmark(args):
+    """Time the detection and scheduling hot paths on synthetic canvases and emit JSON lines"""
+    sizes = [tuple(int(v) for v in size.lower().split('x')) for size in args.sizes.split(',')]
+    pixel_sizes = [float(v) for v in args.pixel_sizes.split(',')]
+    output = open(args.output, 'a') if args.output else None
+    print(f"\n{fade('=== Detection benchmark ===')}")
+    print(f"{Color.GRAY}{'stage':<20}{'canvas':>12}{'pixel':>8}{'grid':>12}{'targets':>9}{'median ms':>11}{'min ms':>9}{Color.RESET}")
+    try:
+        for width, height in sizes:
+            for pixel_size in pixel_sizes:
+                config = Config(canvas_width=width, canvas_height=height, pixel_size=pixel_size,
+                                sparse_capture=args.sparse, scan_workers=args.workers, detector=args.detector)
+                image = make_synthetic_canvas(config, args.nuanced, args.noise, args.seed)
+                changed = make_synthetic_canvas(config, args.nuanced, args.noise, args.seed + 1)
+                # Second frame differs from the first in about 1% of the canvas
+                changed_rows = max(1, height // 100)
+                frame_b = image.copy()
+                frame_b[:changed_rows] = changed[:changed_rows]
+                bot = WPlaceBot()
+                bot.config = config
+                source = SyntheticFrameSource(image)
+                bot.set_frame_source(source)
+                geometry = bot.grid_geometry(width, height)
+                stages = {}
+                with contextlib.redirect_stdout(io.StringIO()):
+                    stages['capture'], frame = time_stage(lambda: bot.capture_canvas(sparse=config.sparse_capture), args.repeats)
+                    source.grabs = 0
+                    bot.capture_canvas(sparse=config.sparse_capture)
+                    capture_grabs = source.grabs
+                    config.incremental_scan = False
+                    stages['detect_full'], small_pixels = time_stage(lambda: bot.detect_small_pixels(frame), args.repeats)
+                    config.incremental_scan = True
+                    bot.scan_frame(image)
+                    frames = [image, frame_b]
+
+                    def incremental_stage():
+                        frames.reverse()
+                        return bot.scan_frame(frames[0])
+                    stages['rescan_incremental'], _ = time_stage(incremental_stage, args.repeats)
+                    result = bot.scan_frame(image)
+                    result.full = True
+
+                    def queue_stage():
+                        bot.small_pixels.reset(None)
+                        bot.apply_scan(result)
+                        for _ in range(min(len(bot.small_pixels), 1000)):
+                            bot.small_pixels.pop()
+                    stages['queue_rebuild_pop1000'], _ = time_stage(queue_stage, args.repeats)
+                    if len(small_pixels) <= args.overlay_limit:
+                        stages['overlay'], _ = time_stage(lambda: bot.render_detection_overlay(image, small_pixels), args.repeats)
+                    if args.click_seconds > 0:
+                        intervals = benchmark_click_loop(bot, args.click_cps, args.click_seconds)
+                        if intervals:
+                            stages['click_loop'] = intervals
+                bot.close()
+                for stage, durations in stages.items():
+                    record = {
+                        'label': args.label,
+                        'stage': stage,
+                        'canvas_width': width,
+                        'canvas_height': height,
+                        'pixel_size': pixel_size,
+                        'grid_width': geometry.grid_width,
+                        'grid_height': geometry.grid_height,
+                        'targets': len(small_pixels),
+                        'nuanced_fraction': args.nuanced,
+                        'noise': args.noise,
+                        'zero_copy': config.zero_copy_capture,
+                        'sparse': config.sparse_capture,
+                        'capture_grabs': capture_grabs,
+                        'workers': config.scan_workers,
+                        'detector': config.detector,
+                        'repeats': len(durations),
+                        'min_ms': min(durations) * 1000,
+                        'median_ms': float(np.median(durations)) * 1000,
+                        'mean_ms': float(np.mean(durations)) * 1000,
+                        'max_ms': max(durations) * 1000,
+                        'p99_ms': float(np.percentile(durations, 99)) * 1000,
+                        'python': platform.python_version(),
+                        'numpy': np.__version__,
+                        'timestamp': time.time(),
+                    }
+                    print(f"{stage:<20}{f'{width}x{height}':>12}{pixel_size:>8.2f}"
+                          f"{f'{geometry.grid_width}x{geometry.grid_height}':>12}{len(small_pixels):>9}"
+                          f"{record['median_ms']:>11.2f}{record['min_ms']:>9.2f}")
+                    if stage == 'click_loop':
+                        record['target_cps'] = args.click_cps
+                        record['achieved_cps'] = 1.0 / record['mean_ms'] * 1000
+                        print(f"{Color.GRAY}  {record['achieved_cps']:.1f} of {args.click_cps:g} CPS, "
+                              f"click interval p99 {record['p99_ms']:.2f}ms{Color.RESET}")
+                    if output is not None:
+                        output.write(json.dumps(record) + '\n')
+                if len(small_pixels) > args.overlay_limit:
+                    print(f"{Color.GRAY}  overlay skipped: {len(small_pixels)} targets > --overlay-limit {args.overlay_limit}{Color.RESET}")
+    finally:
+        if output is not None:
+            output.close()
+            print(f"\n{Color.GREEN}💾 Results appended to {args.output}{Color.RESET}")
+
+BATCH_FRAME_COLUMNS = ('frame', 'timestamp', 'min_color_variance', 'width', 'height', 'grid_width', 'grid_height',
+                       'cells', 'detections', 'mean_score', 'max_score', 'decode_ms', 'gather_ms', 'analyze_ms')
+BATCH_CELL_COLUMNS = ('frame', 'min_color_variance', 'grid_x', 'grid_y', 'canvas_x', 'canvas_y', 'score')
+
+class ColumnarWriter:
+    """Streams rows to CSV, or to Parquet row groups when the path ends in .parquet (needs pyarrow)"""
+    def __init__(self, path, columns, group_rows=65536):
+        self.path = path
+        self.columns = columns
+        self.group_rows = group_rows
+        self.rows = []
+        self.parquet = None
+        if path.endswith('.parquet'):
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ValueError("Parquet output needs pyarrow (pip install pyarrow), or use a .csv path")
+            self.pyarrow = pyarrow
+            self.file = None
+        else:
+            self.file = open(path, 'w', newline='')
+            self.csv = csv.writer(self.file)
+            self.csv.writerow(columns)
+
+    def write(self, rows):
+        if self.file is not None:
+            self.csv.writerows(rows)
+            return
+        self.rows.extend(rows)
+        if len(self.rows) >= self.group_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        table = self.pyarrow.table({name: list(values) for name, values in zip(self.columns, zip(*self.rows))})
+        if self.parquet is None:
+            self.parquet = self.pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        self.parquet.write_table(table)
+        self.rows = []
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            return
+        self.flush()
+        if self.parquet is not None:
+            self.parquet.close()
+
+def batch_frames(path):
+    """Yield (index, timestamp, reference) for every recorded frame; workers decode PNGs and map sessions themselves"""
+    if os.path.isfile(os.path.join(path, 'session.json')):
+        source = RecordedSessionSource(path, speed=0)
+        try:
+            for index, timestamp in enumerate(source.timestamps[:len(source.frames)]):
+                yield index, timestamp, ('session', path, source.shape, len(source.frames), index)
+        finally:
+            source.close()
+    elif os.path.isdir(path):
+        for index, file in enumerate(PngDirectorySource(path, speed=0).files):
+            yield index, None, ('png', file)
+    else:
+        # Video decoding is sequential, decoded frames go to the workers
+        source = VideoFileSource(path, speed=0)
+        try:
+            index = 0
+            while True:
+                frame, timestamp = source.next_frame()
+                if frame is None:
+                    break
+                yield index, timestamp, ('frame', frame)
+                index += 1
+        finally:
+            source.close()
+
+BATCH_WORKER = {'sessions': {}}
+
+def init_batch_worker(config, variances):
+    BATCH_WORKER['bot'] = bot = WPlaceBot()
+    bot.config = config
+    bot.metrics = NO_METRICS
+    BATCH_WORKER['variances'] = variances
+
+def load_batch_frame(reference):
+    kind = reference[0]
+    if kind == 'png':
+        return cv2.imread(reference[1], cv2.IMREAD_COLOR)
+    if kind == 'session':
+        _, path, shape, count, index = reference
+        frames = BATCH_WORKER['sessions'].get(path)
+        if frames is None:
+            frames = BATCH_WORKER['sessions'][path] = np.memmap(os.path.join(path, 'frames.raw'), dtype=np.uint8,
+                                                               mode='r', shape=(count,) + tuple(shape))
+        return frames[index]
+    return reference[1]
+
+def analyze_batch_frame(task):
+    """Detect one recorded frame at every swept min_color_variance; returns frame rows and detected cells"""
+    bot = BATCH_WORKER['bot']
+    config = bot.config
+    index, timestamp, reference = task
+    start = time.perf_counter()
+    frame = load_batch_frame(reference)
+    if frame is None:
+        return [], []
+    decoded = time.perf_counter()
+    geometry = bot.get_grid_geometry(frame)
+    samples = geometry.gather(frame) if config.detector == 'points' else None
+    gathered = time.perf_counter()
+    frame_rows, cell_rows = [], []
+    cells = int(np.count_nonzero(geometry.valid))
+    for min_color_variance in BATCH_WORKER['variances']:
+        analyze_start = time.perf_counter()
+        if samples is not None:
+            has_nuances, scores = analyze_samples(samples, min_color_variance)
+        else:
+            # Region and target detectors read the frame themselves
+            config.min_color_variance = min_color_variance
+            bot.scan_state = None
+            bot.scan_grid(frame)
+            has_nuances, scores = bot.scan_state.has_nuances, bot.scan_state.scores
+        grid_y, grid_x = np.nonzero(has_nuances & geometry.valid)
+        found = scores[grid_y, grid_x]
+        analyze_ms = (time.perf_counter() - analyze_start) * 1000
+        frame_rows.append((index, timestamp, min_color_variance, frame.shape[1], frame.shape[0], geometry.grid_width,
+                           geometry.grid_height, cells, len(found), float(found.mean()) if len(found) else 0.0,
+                           float(found.max()) if len(found) else 0.0, (decoded - start) * 1000,
+                           (gathered - decoded) * 1000, analyze_ms))
+        cell_rows.extend(zip([index] * len(found), [min_color_variance] * len(found), grid_x.tolist(), grid_y.tolist(),
+                             geometry.centers_x[grid_x].round(1).tolist(), geometry.centers_y[grid_y].round(1).tolist(),
+                             found.round(3).tolist()))
+    return frame_rows, cell_rows
+
+def run_batch(args):
+    """Stream a recording through the detector on all cores and write per-frame results"""
+    config = Config()
+    if args.profile:
+        load_profile(config, args.profile)
+    config.incremental_scan = False
+    config.scan_workers = 0
+    if args.batch_detector:
+        config.detector = args.batch_detector
+    variances = [float(v) for v in args.batch_variance.split(',')] if args.batch_variance else [config.min_color_variance]
+    frames = batch_frames(args.batch)
+    first = next(frames, None)
+    if first is None:
+        print(f"{Color.RED}❌ No frames in {args.batch}{Color.RESET}")
+        return
+    # Size the canvas from the recording and calibrate once, every frame then shares the same grid
+    image = load_batch_frame(first[2])
+    config.canvas_height, config.canvas_width = image.shape[:2]
+    if config.auto_calibrate and str(config.zoom_level) not in config.grid_calibrations:
+        calibration = calibrate_grid(image)
+        if calibration is not None and calibration.confidence >= CALIBRATION_MIN_CONFIDENCE:
+            config.pixel_size, config.grid_offset_x, config.grid_offset_y = calibration.pixel_size, calibration.offset_x, calibration.offset_y
+            print(f"{Color.GREEN}✓ Grid calibrated: pixel size {calibration.pixel_size:.4f} px, "
+                  f"offset ({calibration.offset_x:.2f}, {calibration.offset_y:.2f}){Color.RESET}")
+    elif config.auto_calibrate:
+        config.pixel_size, config.grid_offset_x, config.grid_offset_y = config.grid_calibrations[str(config.zoom_level)]
+    workers = args.batch_workers if args.batch_workers is not None else os.cpu_count() or 1
+    print(f"\n{fade('=== Batch analysis ===')}")
+    print(f"{Color.GRAY}{args.batch}: {config.canvas_width}x{config.canvas_height} px, pixel size {config.pixel_size:.4f} px, "
+          f"detector {config.detector}, min_color_variance {', '.join(f'{v:g}' for v in variances)}, "
+          f"{workers or 'no'} worker processes{Color.RESET}")
+    frame_writer = ColumnarWriter(args.batch_output, BATCH_FRAME_COLUMNS)
+    cell_writer = ColumnarWriter(args.batch_cells, BATCH_CELL_COLUMNS) if args.batch_cells else None
+    pool = multiprocessing.get_context('spawn').Pool(workers, initializer=init_batch_worker, initargs=(config, variances)) if workers else None
+    if pool is None:
+        init_batch_worker(config, variances)
+    # At most two frames per worker are in flight, so memory stays bounded however long the recording is
+    pending = deque()
+    start = last_report = time.perf_counter()
+    count = 0
+
+    def drain(result):
+        nonlocal count, last_report
+        frame_rows, cell_rows = result
+        frame_writer.write(frame_rows)
+        if cell_writer is not None:
+            cell_writer.write(cell_rows)
+        count += 1
+        if time.perf_counter() - last_report >= 2.0:
+            last_report = time.perf_counter()
+            print(f"{Color.GRAY}  {count} frames, {count / (last_report - start):.1f} frames/s{Color.RESET}")
+    try:
+        for task in itertools.chain([first], frames):
+            if pool is None:
+                drain(analyze_batch_frame(task))
+                continue
+            pending.append(pool.apply_async(analyze_batch_frame, (task,)))
+            if len(pending) >= workers * 2:
+                drain(pending.popleft().get())
+        while pending:
+            drain(pending.popleft().get())
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        frame_writer.close()
+        if cell_writer is not None:
+            cell_writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"{Color.GREEN}✓ {count} frames in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} frames/s), "
+          f"results written to {args.batch_output}{Color.RESET}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='WPlace LegitBot')
+    parser.add_argument('--benchmark', action='store_true', help='run the headless detection benchmark and exit')
+    parser.add_argument('--sizes', default='1000x1000,1920x1080,3840x2160', help='benchmark canvas sizes, WxH comma separated')
+    parser.add_argument('--pixel-sizes', default='41.07,10', help='benchmark pixel sizes, comma separated')
+    parser.add_argument('--nuanced', type=float, default=0.2, help='fraction of nuanced cells in synthetic canvases')
+    parser.add_argument('--noise', type=float, default=0.0, help='gaussian noise std-dev added to synthetic canvases')
+    parser.add_argument('--repeats', type=int, default=5, help='timed runs per stage')
+    parser.add_argument('--seed', type=int, default=0, help='synthetic canvas random seed')
+    parser.add_argument('--workers', type=int, default=0, help='scan worker processes to benchmark')
+    parser.add_argument('--sparse', action='store_true', help='benchmark sparse capture')
+    parser.add_argument('--detector', choices=('points', 'region'), default='points', help='detector to benchmark')
+    parser.add_argument('--overlay-limit', type=int, default=1000000, help='skip overlay timing above this many targets')
+    parser.add_argument('--label', default='', help='tag stored with every result, e.g. a version or branch')
+    parser.add_argument('--output', default='', help='append JSON lines results to this file')
+    parser.add_argument('--metrics-file', default='', help='periodically export stage latencies, JSON or Prometheus text (.prom)')
+    parser.add_argument('-v', '--verbose', action='count', default=0, help='print every click (console verbosity +1)')
+    parser.add_argument('--quiet', action='store_true', help='only print errors and the status line')
+    parser.add_argument('--log-file', default='', help='append structured JSON lines events (all levels) to this file')
+    parser.add_argument('--profile-scan', default='', help='run the first scan under cProfile and dump pstats here')
+    parser.add_argument('--batch', default='', help='analyze a recording (PNG directory, video or recorded session) and exit')
+    parser.add_argument('--batch-output', default='batch.csv', help='per-frame results, CSV or Parquet (.parquet, needs pyarrow)')
+    parser.add_argument('--batch-cells', default='', help='also write every detected cell to this CSV or Parquet file')
+    parser.add_argument('--batch-variance', default='', help='min_color_variance values to sweep, comma separated (default: the profile\'s)')
+    parser.add_argument('--batch-detector', choices=('points', 'region', 'target'), default=None, help='detector for --batch (default: the profile\'s)')
+    parser.add_argument('--batch-workers', type=int, default=None, help='worker processes for --batch (default: one per core, 0 = in process)')
+    parser.add_argument('--profile', default='', help='load this saved profile (canvas, calibration, thresholds, CPS) and save it back on exit')
+    parser.add_argument('--start', action='store_true', help='start clicking right away instead of showing the menu')
+    parser.add_argument('--start-delay', type=float, default=0.0, help='seconds to wait before --start begins clicking')
+    parser.add_argument('--input-backend', choices=tuple(INPUT_BACKENDS), default=None, help='how clicks are sent (default pyautogui)')
+    parser.add_argument('--input-record', default='', help='record backend: write click timestamps to this CSV on exit')
+    parser.add_argument('--click-cps', type=float, default=100.0, help='benchmark: target CPS of the headless click loop')
+    parser.add_argument('--click-seconds', type=float, default=2.0, help='benchmark: seconds of headless click loop per canvas (0 = skip)')
+    parser.add_argument('--preview', default='', help="while the bot runs, write annotated scans to this video file, or 'window' to show them")
+    parser.add_argument('--preview-fps', type=float, default=None, help='preview frame rate cap (default 2)')
+    parser.add_argument('--control-port', type=int, default=0, help='serve the control API on 127.0.0.1:PORT while the bot runs (0 = off)')
+    parser.add_argument('--control-token', default=os.environ.get('WPLACE_CONTROL_TOKEN', ''),
+                        help='bearer token required by the control API (default: $WPLACE_CONTROL_TOKEN)')
+    return parser.parse_args(argv)
+
 def print_logo():
     logo = r"""
 
@@ -316,9 +3417,56 @@ def print_logo():
     print(f"{Color.RED}                by gitlxBD{Color.RESET}")
     print(f"{Color.RED}                contact: rabaisseur on Discord{Color.RESET}\n")
     
-def main():
+def main(args=None):
     print_logo()
     bot = WPlaceBot()
+    if args is not None:
+        if args.profile:
+            try:
+                load_profile(bot.config, args.profile)
+                print(f"{Color.GREEN}✓ Profile '{args.profile}' loaded{Color.RESET}")
+            except FileNotFoundError:
+                bot.config.profile = args.profile
+                print(f"{Color.YELLOW}⚠ Profile '{args.profile}' does not exist yet, it will be created on exit{Color.RESET}")
+        # Flags given on the command line override the profile for this run, saving keeps the profile's values
+        if args.metrics_file:
+            bot.override_setting('metrics_file', args.metrics_file)
+        if args.profile_scan:
+            bot.override_setting('profile_scan_path', args.profile_scan)
+        if args.quiet or args.verbose:
+            bot.override_setting('verbosity', LOG_ERROR if args.quiet else min(LOG_DEBUG, LOG_INFO + args.verbose))
+        if args.log_file:
+            bot.override_setting('log_file', args.log_file)
+        if args.control_port:
+            bot.override_setting('control_port', args.control_port)
+        bot.config.control_token = args.control_token
+        if args.input_backend:
+            bot.override_setting('input_backend', args.input_backend)
+        if args.input_record:
+            bot.override_setting('input_record_path', args.input_record)
+        if args.preview:
+            bot.override_setting('preview', args.preview)
+        if args.preview_fps:
+            bot.override_setting('preview_fps', args.preview_fps)
+    try:
+        if bot.config.frame_source != 'screen':
+            bot.set_frame_source(create_frame_source(bot.config))
+    except (ValueError, OSError) as e:
+        print(f"{Color.RED}❌ Cannot open the profile's frame source: {e}, using live capture{Color.RESET}")
+        bot.config.frame_source = 'screen'
+    try:
+        bot.set_input_backend(create_input_backend(bot.config))
+    except OSError as e:
+        print(f"{Color.RED}❌ {e}, falling back to pyautogui{Color.RESET}")
+        bot.override_setting('input_backend', 'pyautogui')
+    if args is not None and args.start:
+        if not bot.canvas_configured():
+            print(f"{Color.RED}❌ The canvas area is not configured, run the menu once and save a profile{Color.RESET}")
+            return
+        time.sleep(args.start_delay)
+        bot.run_smart_clicker()
+        bot.close()
+        return
     print(f"\n{Color.GREEN}✓ Fixed pixel size: {bot.config.pixel_size:.4f} px ( ?zoom=17 ){Color.RESET}")
     print(f"{Color.GREEN}✓ Mode: Instant teleport{Color.RESET}")
     print(f"{Color.GREEN}✓ Default CPS: {bot.config.clicks_per_second} clicks/sec{Color.RESET}")
@@ -329,17 +3477,19 @@ def main():
             print(f"{Color.GREEN}2.{Color.RESET} Test detection")
             print(f"{Color.GREEN}3.{Color.RESET} Start smart bot")
             print(f"{Color.GREEN}4.{Color.RESET} Edit parameters")
-            print(f"{Color.GREEN}5.{Color.RESET} Quit")
+            print(f"{Color.GREEN}5.{Color.RESET} Frame source")
+            print(f"{Color.GREEN}6.{Color.RESET} Profiles")
+            print(f"{Color.GREEN}7.{Color.RESET} Quit")
             choice = input(f"\n{Color.CYAN}Your choice: {Color.RESET}").strip()
             if choice == '1':
                 bot.configure_canvas()
             elif choice == '2':
-                if bot.config.canvas_width == 1000 and bot.config.canvas_top_left_x == 0:
+                if not bot.canvas_configured():
                     print(f"{Color.YELLOW}⚠ Please configure the canvas area first (option 1){Color.RESET}")
                 else:
                     bot.test_detection()
             elif choice == '3':
-                if bot.config.canvas_width == 1000 and bot.config.canvas_top_left_x == 0:
+                if not bot.canvas_configured():
                     print(f"{Color.YELLOW}⚠ Please configure the canvas area first (option 1){Color.RESET}")
                 else:
                     print(f"\n{Color.GREEN}⚡ Mode: Teleport at {bot.config.clicks_per_second} CPS{Color.RESET}")
@@ -359,7 +3509,29 @@ def main():
                             print(f"{Color.GREEN}✓ CPS set: {new_cps} clicks/s (delay: {1.0/new_cps:.3f}s){Color.RESET}")
                         else:
                             print(f"{Color.YELLOW}⚠ CPS must be between 0.1 and 100{Color.RESET}")
-                    print(f"\n{Color.CYAN}Current pixel size: {bot.config.pixel_size:.4f} px{Color.RESET}")
+                    backend = input(f"{Color.CYAN}Input backend, {' / '.join(INPUT_BACKENDS)} [{bot.config.input_backend}]: {Color.RESET}").strip().lower()
+                    if backend in INPUT_BACKENDS:
+                        previous = bot.config.input_backend
+                        bot.config.input_backend = backend
+                        try:
+                            bot.set_input_backend(create_input_backend(bot.config))
+                            print(f"{Color.GREEN}✓ Input: {INPUT_BACKENDS[backend]}{Color.RESET}")
+                        except OSError as e:
+                            bot.config.input_backend = previous
+                            print(f"{Color.RED}❌ {e}, keeping {previous}{Color.RESET}")
+                    elif backend:
+                        print(f"{Color.YELLOW}⚠ Input backend must be one of: {', '.join(INPUT_BACKENDS)}{Color.RESET}")
+                    zoom = input(f"\n{Color.CYAN}wplace zoom level [{bot.config.zoom_level}]: {Color.RESET}").strip()
+                    if zoom:
+                        bot.config.zoom_level = int(zoom)
+                        if bot.apply_calibration():
+                            print(f"{Color.GREEN}✓ Using the calibration cached for zoom {bot.config.zoom_level}{Color.RESET}")
+                    auto = input(f"{Color.CYAN}Auto-calibrate grid from captures? (y/n) [{'y' if bot.config.auto_calibrate else 'n'}]: {Color.RESET}").strip().lower()
+                    if auto:
+                        bot.config.auto_calibrate = auto == 'y'
+                    print(f"\n{Color.CYAN}Current pixel size: {bot.config.pixel_size:.4f} px, grid offset ({bot.config.grid_offset_x:.2f}, {bot.config.grid_offset_y:.2f}){Color.RESET}")
+                    if bot.config.auto_calibrate:
+                        print(f"{Color.GRAY}   Auto-calibration overrides a custom size once the zoom level is calibrated{Color.RESET}")
                     custom = input(f"{Color.CYAN}Custom size? (y/n) [n]: {Color.RESET}").strip().lower()
                     if custom == 'y':
                         size = input(f"{Color.CYAN}New size [{bot.config.pixel_size:.4f}]: {Color.RESET}").strip()
@@ -368,18 +3540,53 @@ def main():
                     print(f"\n{Color.CYAN}Min unique colors: {bot.config.min_unique_colors}{Color.RESET}")
                     colors = input(f"{Color.CYAN}New minimum (2-10) [{bot.config.min_unique_colors}]: {Color.RESET}").strip()
                     if colors:
-                        bot.config.min_unique_colors = int(colors)
+                        bot.config.min_unique_colors = coerce_setting('min_unique_colors', colors)
                     print(f"\n{Color.CYAN}Min variance: {bot.config.min_color_variance}{Color.RESET}")
                     variance = input(f"{Color.CYAN}New variance (5-50) [{bot.config.min_color_variance}]: {Color.RESET}").strip()
                     if variance:
-                        bot.config.min_color_variance = float(variance)
-                    scan = input(f"\n{Color.CYAN}Scan interval [{bot.config.scan_interval}s]: {Color.RESET}").strip()
-                    if scan:
+                        bot.config.min_color_variance = coerce_setting('min_color_variance', variance)
+                    detector = input(f"{Color.CYAN}Detector, points = 5 samples per cell, region = whole cell, target = diff against an image [{bot.config.detector}]: {Color.RESET}").strip().lower()
+                    if detector in ('points', 'region', 'target'):
+                        bot.config.detector = detector
+                    elif detector:
+                        print(f"{Color.YELLOW}⚠ Detector must be 'points', 'region' or 'target'{Color.RESET}")
+                    if bot.config.detector == 'target':
+                        target = input(f"{Color.CYAN}Target PNG, one pixel per wplace pixel [{bot.config.target_path}]: {Color.RESET}").strip()
+                        if target:
+                            if not os.path.isfile(target):
+                                raise ValueError(f"no such file {target}")
+                            bot.config.target_path = target
+                        offset = input(f"{Color.CYAN}Target offset in grid pixels x,y [{bot.config.target_offset_x},{bot.config.target_offset_y}]: {Color.RESET}").strip()
+                        if offset:
+                            bot.config.target_offset_x, bot.config.target_offset_y = (int(v) for v in offset.split(','))
+                    current = 'auto' if bot.config.adaptive_scan else f"{bot.config.scan_interval}s"
+                    scan = input(f"\n{Color.CYAN}Scan interval in seconds, 'auto' = adaptive [{current}]: {Color.RESET}").strip().lower()
+                    if scan == 'auto':
+                        bot.config.adaptive_scan = True
+                    elif scan:
                         bot.config.scan_interval = float(scan)
+                        bot.config.adaptive_scan = False
+                    workers = input(f"{Color.CYAN}Scan worker processes, 0 = single process [{bot.config.scan_workers}]: {Color.RESET}").strip()
+                    if workers:
+                        bot.config.scan_workers = max(0, int(workers))
                     print(f"\n{Color.GREEN}✓ Configuration updated{Color.RESET}")
                 except ValueError:
                     print(f"{Color.RED}❌ Invalid values{Color.RESET}")
             elif choice == '5':
+                try:
+                    bot.configure_frame_source()
+                except (ValueError, IndexError, OSError) as e:
+                    print(f"{Color.RED}❌ Invalid frame source: {e}{Color.RESET}")
+            elif choice == '6':
+                try:
+                    bot.manage_profiles()
+                except (ValueError, OSError) as e:
+                    print(f"{Color.RED}❌ Profile error: {e}{Color.RESET}")
+            elif choice == '7':
+                if bot.config.profile:
+                    bot.save_profile(bot.config.profile)
+                    print(f"{Color.GREEN}💾 Profile '{bot.config.profile}' saved{Color.RESET}")
+                bot.close()
                 print(f"\n{fade('Goodbye!')}")
                 break
             else:
@@ -390,6 +3597,7 @@ def main():
         print(f"{Color.CYAN}pip install pyautogui keyboard opencv-python numpy mss{Color.RESET}")
         
 if __name__ == "__main__":
+    args = parse_args()
     try:
         required_packages = {
             'pyautogui': 'Mouse control and screen interaction',
@@ -398,18 +3606,11 @@ if __name__ == "__main__":
             'numpy': 'Numerical computations',
             'mss': 'Fast screen capture',
         }
-        missing_packages = []
-        try:
-            import pyautogui
-            import keyboard
-            import cv2
-            import numpy as np
-            import mss
-            import time 
-        except ImportError as e:
-            package = str(e).split("'")[1]
-            if package in required_packages:
-                missing_packages.append(package)
+        modules = {'pyautogui': 'pyautogui', 'keyboard': 'keyboard', 'opencv-python': 'cv2', 'numpy': 'numpy', 'mss': 'mss'}
+        optional = ('pyautogui', 'keyboard') if args.benchmark or args.batch else ()
+        # Only look the packages up here, LazyModule imports them when they are first used
+        missing_packages = [package for package, module in modules.items()
+                            if package not in optional and importlib.util.find_spec(module) is None]
         if missing_packages:
             print(f"\n{Color.RED}❌ Missing dependencies!{Color.RESET}")
             print(f"\n{Color.YELLOW}Missing packages:{Color.RESET}")
@@ -418,7 +3619,12 @@ if __name__ == "__main__":
             print(f"\n{Color.GREEN}Install with:{Color.RESET}")
             print(f"{Color.CYAN}pip install {' '.join(missing_packages)}{Color.RESET}")
             exit(1)
-        main()
+        if args.benchmark:
+            run_benchmark(args)
+        elif args.batch:
+            run_batch(args)
+        else:
+            main(args)
     except Exception as e:
         print(f"\n{Color.RED}❌ Error: {e}{Color.RESET}")
         print(f"\n{Color.YELLOW}If this is a dependency error, install required packages with:{Color.RESET}")